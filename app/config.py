@@ -6,3 +6,7 @@ UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
 
 # Create upload dir if missing
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+# Uploads are streamed to disk in chunks; anything larger than this is rejected
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_MB", "200")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_KB", "1024")) * 1024
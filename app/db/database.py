@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.config import BASE_DIR
 import os
@@ -9,3 +9,17 @@ SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+
+
+def add_missing_columns(table):
+    """create_all() never alters existing tables: add (nullable) columns and indexes introduced since."""
+    insp = inspect(engine)
+    if not insp.has_table(table.name):
+        return
+    existing = {c["name"] for c in insp.get_columns(table.name)}
+    with engine.begin() as conn:
+        for col in table.columns:
+            if col.name not in existing:
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col.type.compile(engine.dialect)}"))
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
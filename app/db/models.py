@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Text, Float, DateTime, ForeignKey
 from sqlalchemy.orm import relationship
 from app.db.database import Base
 
@@ -23,3 +24,42 @@ class Section(Base):
 
     document = relationship("Document", back_populates="sections")
     children = relationship("Section", cascade="all, delete-orphan")
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+    id = Column(String, primary_key=True, index=True)   # uuid hex
+    filename = Column(String)
+    path = Column(String)
+    document_id = Column(Integer, nullable=True)         # reserved at upload time
+    options = Column(Text, default="{}")                 # JSON-encoded upload flags
+    status = Column(String, default="queued", index=True)  # queued, running, completed, failed
+    stage = Column(String, nullable=True)                # current (or failed) stage
+    progress = Column(Float, default=0.0)                # 0.0 .. 1.0
+    attempts = Column(Integer, default=0)                # attempts of the current stage
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Chunk(Base):
+    __tablename__ = "chunks"
+    vector_id = Column(Integer, primary_key=True, autoincrement=False)  # id in the FAISS index
+    doc_id = Column(Integer, index=True, nullable=True)
+    chunk_id = Column(Integer, default=0)
+    source = Column(String, index=True, nullable=True)
+    page = Column(Integer, nullable=True)
+    start_offset = Column(Integer, nullable=True)  # char offsets into Document.text
+    end_offset = Column(Integer, nullable=True)
+    text = Column(Text, nullable=True)             # only when the text is not part of a Document
+    section_id = Column(Integer, index=True, nullable=True)  # Section the chunk starts in
+    extra = Column(Text, nullable=True)            # JSON of any other metadata keys
+
+class Summary(Base):
+    __tablename__ = "summaries"
+    key = Column(String, primary_key=True)         # sha256 of (doc, section, model, params, text hash)
+    doc_id = Column(Integer, index=True, nullable=True)  # None for ad-hoc uploads / raw text
+    section_id = Column(Integer, nullable=True)
+    model = Column(String)
+    params = Column(String)                        # JSON of the generation settings
+    text_hash = Column(String)                     # sha256 of the summarized text
+    summary = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
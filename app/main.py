@@ -1,9 +1,25 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from app.routes import file_routes
 from app.routes import structure_routes
 from app.routes import nlp_routes
+from app.routes import job_routes
+from app.services import ingestion
+from app.services import extraction_cache
+from app.services import embedding_cache
+from app.services import embedding_service
+from app.services import answer_cache
+from app.services import ocr_pool
+from app.services import embeddings_store
+from app.services import model_registry
+from app.services import summary_store
+from app.services.qa import GEN_MODEL
+from app.services import summarizer
+from app.services.summarizer import SUMMARIZER_MODEL
 from app.services.visualization import hierarchy_to_mermaid
+from app.utils.file_handler import UploadTooLarge
 from fastapi.middleware.cors import CORSMiddleware
+import threading
 
 app = FastAPI(title="Document Handling API", version="1.0")
 # CORS for frontend dev
@@ -19,12 +35,60 @@ app.add_middleware(
 app.include_router(file_routes.router)
 app.include_router(structure_routes.router)
 app.include_router(nlp_routes.router)
+app.include_router(job_routes.router)
+
+@app.exception_handler(UploadTooLarge)
+async def upload_too_large(request: Request, exc: UploadTooLarge):
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
+@app.on_event("startup")
+def start_background_work():
+    embeddings_store.recover()
+    ingestion.resume_jobs()
+    if model_registry.GEN_WARMUP:
+        # in the background so the API is up meanwhile; early requests wait on the registry lock
+        threading.Thread(target=model_registry.warm_up, args=(GEN_MODEL, SUMMARIZER_MODEL),
+                         name="model-warmup", daemon=True).start()
+
+@app.on_event("shutdown")
+def stop_background_work():
+    ingestion.shutdown()
+    ocr_pool.shutdown()
+    embeddings_store.shutdown()
+    embedding_service.shutdown()
+    summary_store.shutdown()
 
 @app.get("/")
 def root():
     return {"message": "Document Handling API Ready"}
 
 
+@app.get("/stats/caches")
+def cache_stats():
+    """Hit/miss counters for the server-side caches."""
+    return {"extraction": extraction_cache.stats(), "embedding": embedding_cache.stats(),
+            **embeddings_store.cache_stats(), "answers": answer_cache.stats(),
+            "summaries": summary_store.stats()}
+
+
+@app.get("/stats/index")
+def index_stats():
+    """Vector index type, size and ANN promotion state."""
+    return embeddings_store.index_info()
+
+
+@app.get("/stats/embedding")
+def embedding_stats():
+    """Request/batch counters of the shared embedding model."""
+    return embedding_service.stats()
+
+
+@app.get("/stats/models")
+def model_stats():
+    """Loaded generation models, their quantization/thread settings and summarization batches."""
+    return {**model_registry.info(), "summary_batches": summarizer.batch_stats()}
+
+
 @app.post("/visualization/mermaid")
 async def get_mermaid_chart(hierarchy: dict):
     mermaid_code = hierarchy_to_mermaid(hierarchy)
@@ -1,10 +1,12 @@
 # app/routes/file_routes.py
 from fastapi import APIRouter, File, UploadFile, Query, HTTPException
-from app.utils.file_handler import save_file
-from app.services.extractor import extract_and_clean
+from app.utils.file_handler import save_upload, UploadTooLarge
+from app.services.extraction_cache import extract_and_clean_cached
+from app.services.extractor import SUPPORTED_TYPES
 from app.db.database import SessionLocal
 from app.db.models import Document
-from app.services.embeddings_store import add_texts
+from app.services.ingestion import submit_job
+from app.services.summary_store import SUMMARY_PRECOMPUTE
 import os
 
 router = APIRouter()
@@ -14,25 +16,26 @@ async def upload_file(
     file: UploadFile = File(...),
     extract: bool = Query(True, description="If true, extract text"),
     save_to_db: bool = Query(True, description="If true, save doc & text to DB"),
-    create_embeddings: bool = Query(True, description="If true, create embeddings for QnA")
+    create_embeddings: bool = Query(True, description="If true, create embeddings for QnA"),
+    summarize: bool = Query(SUMMARY_PRECOMPUTE, description="If true, precompute summaries in the background")
 ):
     """
-    Upload a file, optionally extract text and/or save to DB.
+    Upload a file and queue it for background ingestion.
+    Returns immediately with a job id; poll GET /jobs/{job_id} for progress.
+    The document row is reserved up front so doc_id is known right away.
     """
     try:
-        file_bytes = await file.read()
-        path = save_file(file_bytes, file.filename)
-        
-        text = None
-        if extract:
-            ext = os.path.splitext(file.filename)[-1].replace(".", "")
-            text = extract_and_clean(path, ext)
+        ext = os.path.splitext(file.filename or "")[-1].replace(".", "").lower()
+        if extract and ext not in SUPPORTED_TYPES:
+            # reject now rather than queue a job whose extract stage can only fail
+            raise ValueError("Unsupported file type")
+        path, digest = await save_upload(file)
 
         doc_id = None
         if save_to_db:
             db = SessionLocal()
             try:
-                doc = Document(filename=file.filename, original_path=path, text=text or "")
+                doc = Document(filename=file.filename, original_path=path, text="")
                 db.add(doc)
                 db.commit()
                 db.refresh(doc)
@@ -40,22 +43,22 @@ async def upload_file(
             finally:
                 db.close()
 
-        # 🔹 Create embeddings so QnA works immediately
-        if create_embeddings and text:
-            paras = [p.strip() for p in text.split("\n\n") if p.strip()]
-            texts = []
-            metas = []
-            for i, p in enumerate(paras):
-                texts.append(p)
-                metas.append({"source": file.filename, "chunk_id": i, "text": p, "doc_id": doc_id})
-            add_texts(texts, metas)
+        job_id = submit_job(file.filename, path, document_id=doc_id, options={
+            "extract": extract,
+            "create_embeddings": create_embeddings,
+            "summarize": summarize,
+            "sha256": digest,
+        })
 
         return {
             "filename": file.filename,
             "path": path,
             "doc_id": doc_id,
-            "extracted_text": text
+            "job_id": job_id,
+            "status": "queued"
         }
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -65,12 +68,14 @@ async def upload_file(
 @router.post("/extract/")
 async def extract_file(file: UploadFile = File(...)):
     """Upload, save, and extract text from a file."""
-    file_bytes = await file.read()
-    path = save_file(file_bytes, file.filename)
+    try:
+        path, digest = await save_upload(file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
 
     ext = os.path.splitext(file.filename)[-1].replace(".", "")
     try:
-        text = extract_and_clean(path, ext)
+        text = extract_and_clean_cached(path, ext, digest)
         return {"filename": file.filename, "extracted_text": text}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -93,55 +98,10 @@ def list_documents():
 
 
 from fastapi import status
-from app.services.embeddings_store import _metadata, _index, save_index, _init_index, clear_store
-import faiss
+from app.services.documents import delete_document as delete_document_record
 
 @router.delete("/documents/{doc_id}", status_code=status.HTTP_200_OK)
 def delete_document(doc_id: int):
-    db = SessionLocal()
-    try:
-        # Get the document
-        doc = db.query(Document).filter(Document.id == doc_id).first()
-        if not doc:
-            raise HTTPException(status_code=404, detail="Document not found")
-
-        # Remove file from uploads folder
-        if doc.original_path and os.path.exists(doc.original_path):
-            try:
-                os.remove(doc.original_path)
-            except Exception as e:
-                print(f"Warning: could not remove file {doc.original_path}: {e}")
-
-        # Remove embeddings for this document
-        _init_index(384)  # adjust to your embedding dimension
-        if _metadata:
-            ids_to_keep = []
-            vectors_to_keep = []
-            for idx in range(_index.ntotal):
-                md = _metadata.get(idx)
-                if md and md.get("doc_id") != doc_id:
-                    ids_to_keep.append(idx)
-                    vectors_to_keep.append(_index.reconstruct(idx))
-
-            if vectors_to_keep:
-                new_index = faiss.IndexFlatIP(_index.d)
-                new_index.add(vectors_to_keep)
-                _index.reset()
-                _index.add(vectors_to_keep)
-                # rebuild metadata
-                new_metadata = {}
-                for new_id, old_id in enumerate(ids_to_keep):
-                    new_metadata[new_id] = _metadata[old_id]
-                _metadata.clear()
-                _metadata.update(new_metadata)
-                save_index()
-            else:
-                clear_store()
-
-        # Delete from DB (sections will cascade delete)
-        db.delete(doc)
-        db.commit()
-
-        return {"deleted": True, "doc_id": doc_id}
-    finally:
-        db.close()
+    if not delete_document_record(doc_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"deleted": True, "doc_id": doc_id}
@@ -0,0 +1,29 @@
+# app/routes/job_routes.py
+from fastapi import APIRouter, HTTPException, Query
+from app.services.ingestion import get_job, list_jobs, retry_job
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+@router.get("")
+def jobs_list(limit: int = Query(50, ge=1, le=500)):
+    """Most recent ingestion jobs first."""
+    return list_jobs(limit)
+
+@router.get("/{job_id}")
+def job_status(job_id: str):
+    """Status, current stage and progress (0..1) of an ingestion job."""
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/{job_id}/retry")
+def job_retry(job_id: str):
+    """Re-run a failed job starting from the stage that failed."""
+    try:
+        job = retry_job(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
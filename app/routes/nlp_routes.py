@@ -1,44 +1,111 @@
 # app/routes/nlp_routes.py
 from fastapi import APIRouter, File, UploadFile, Body, Query,HTTPException
-from typing import Optional, List
-from app.utils.file_handler import save_file
-from app.services.extractor import extract_and_clean
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import Optional, List, Iterator, Dict, Any
+from app.utils.file_handler import save_upload, UploadTooLarge
+from app.services.extraction_cache import extract_and_clean_cached, extract_cached
+from app.services.chunker import chunk_pages, chunk_text
+from app.services.cleaner import clean_text
 from app.services.structure import detect_sections, sections_to_json
-from app.services.summarizer import summarize_text, summarize_sections
+from app.services.summarizer import summarize_text, stream_summary, summarize_long, prefilter_text
+from app.services.summary_store import document_summary, section_summaries, stored_sections
+from app.services.extractive import extractive_summary, extractive_summaries, EXTRACTIVE_SENTENCES
 from app.services.embeddings_store import add_texts, search, clear_store
-from app.services.qa import retrieve_and_answer
+from app.services.qa import retrieve_and_answer, stream_answer, answer_batch
 from app.utils.file_processor import process_upload
 from app.db.database import SessionLocal
 from app.db.models import Document
+import json
 import os
 
 router = APIRouter(prefix="/nlp", tags=["NLP"])
 
-@router.post("/summarize/document")
-async def summarize_document(file: UploadFile = File(None), raw_text: Optional[str] = Body(default=None),
-                             max_length: int = 200):
+QA_BATCH_MAX = int(os.environ.get("QA_BATCH_MAX", "256"))  # questions per /qa/batch request
+
+
+def _sse(events: Iterator[Dict[str, Any]]) -> StreamingResponse:
+    """
+    Server-Sent Events response. The (blocking) event generator is iterated in the
+    threadpool by Starlette, so generation never runs on the event loop.
+    """
+    def encode():
+        try:
+            for ev in events:
+                yield f"event: {ev['event']}\ndata: {json.dumps(ev)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'event': 'error', 'detail': str(e)})}\n\n"
+    return StreamingResponse(encode(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def _upload_text(file: Optional[UploadFile], raw_text: Optional[str]) -> str:
     try:
         _, text = await process_upload(file, raw_text)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    return text
+
+# abstractive: the seq2seq model; extractive: top-N central sentences, no generation;
+# hybrid: extractive pre-filter down to one encoder pass, then abstractive
+SUMMARY_MODES = ("abstractive", "extractive", "hybrid")
 
-    summary = summarize_text(text, max_length=max_length, min_length=30)
+def _check_mode(mode: str, allowed=SUMMARY_MODES) -> str:
+    if mode not in allowed:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(allowed)}")
+    return mode
+
+@router.post("/summarize/document")
+async def summarize_document(file: UploadFile = File(None), raw_text: Optional[str] = Body(default=None),
+                             max_length: int = 200, mode: str = "abstractive",
+                             sentences: int = Query(EXTRACTIVE_SENTENCES, ge=1, le=100)):
+    _check_mode(mode)
+    text = await _upload_text(file, raw_text)
+    if mode == "extractive":
+        return await run_in_threadpool(extractive_summary, text, sentences)
+    if mode == "hybrid":
+        summary = await run_in_threadpool(summarize_long, text, max_length=max_length, min_length=30,
+                                          prefilter=True)
+    else:
+        summary = await run_in_threadpool(summarize_text, text, max_length=max_length, min_length=30)
     return {"summary": summary}
 
+@router.post("/summarize/document/stream")
+async def summarize_document_stream(file: UploadFile = File(None), raw_text: Optional[str] = Body(default=None),
+                                    max_length: int = 200, mode: str = "abstractive"):
+    """
+    Same as /summarize/document, streamed as Server-Sent Events:
+    `token` events with summary pieces, then `done` with the full summary.
+    """
+    _check_mode(mode, ("abstractive", "hybrid"))
+    text = await _upload_text(file, raw_text)
+
+    def events():
+        source = prefilter_text(text) if mode == "hybrid" else text
+        pieces = []
+        for piece in stream_summary(source, max_length=max_length, min_length=30):
+            pieces.append(piece)
+            yield {"event": "token", "text": piece}
+        yield {"event": "done", "summary": "".join(pieces).strip()}
+    return _sse(events())
+
 @router.post("/summarize/sections")
 async def summarize_document_sections(file: UploadFile = File(None),
                                       raw_text: Optional[str] = Body(default=None),
-                                      per_section_max: int = 120):
+                                      per_section_max: int = 120, mode: str = "abstractive",
+                                      sentences: int = Query(2, ge=1, le=20)):
     """
-    Summarize each detected heading/section.
+    Summarize each detected heading/section (mode=extractive: its most central sentences).
     """
+    _check_mode(mode, ("abstractive", "extractive"))
     if file is None and not raw_text:
         return {"error": "Provide file or raw_text"}
     if file:
-        fb = await file.read()
-        path = save_file(fb, file.filename)
+        path, digest = await save_upload(file)
         ext = os.path.splitext(file.filename)[-1].replace(".", "")
-        text = extract_and_clean(path, ext)
+        text = extract_and_clean_cached(path, ext, digest)
     else:
         text = raw_text
 
@@ -47,47 +114,100 @@ async def summarize_document_sections(file: UploadFile = File(None),
     def node_to_dict(n):
         return {"title": n.title, "level": n.level, "content": n.content}
     nodes_list = [node_to_dict(n) for n in nodes]
-    summaries = summarize_sections(nodes_list, per_section_max)
+    if mode == "extractive":
+        summaries = await run_in_threadpool(_extractive_sections, nodes_list, sentences)
+    else:
+        # batched generation takes seconds; keep it off the event loop
+        summaries = await run_in_threadpool(section_summaries, nodes_list, per_section_max)
     return {"section_summaries": summaries}
 
+def _extractive_sections(sections: List[dict], sentences: int) -> List[dict]:
+    results = extractive_summaries([s.get("content") or "" for s in sections], sentences)
+    return [{"title": s.get("title"), "summary": r["summary"]} for s, r in zip(sections, results)]
+
 @router.post("/embeddings/add")
 async def embeddings_add(file: UploadFile = File(None), raw_text: Optional[str] = Body(default=None),
                          doc_id: Optional[int] = None):
     """
-    Extract text and split into passage chunks, create embeddings and add to FAISS.
+    Extract text and split into token-bounded passage chunks, create embeddings and add to FAISS.
     """
     if file is None and not raw_text:
         return {"error": "Provide file or raw_text"}
     if file:
-        fb = await file.read()
-        path = save_file(fb, file.filename)
+        path, digest = await save_upload(file)
         ext = os.path.splitext(file.filename)[-1].replace(".", "")
-        text = extract_and_clean(path, ext)
-        source = file.filename
+        # extraction (maybe OCR), chunking and the encode wait all block: off the event loop
+        ids = await run_in_threadpool(_add_file, path, ext, digest, file.filename, doc_id)
     else:
-        text = raw_text
-        source = "raw_text"
-
-    # simple chunking by paragraphs or sentences (adjust chunk size as required)
-    paras = [p.strip() for p in text.split("\n\n") if p.strip()]
-    texts = []
-    metas = []
-    for i, p in enumerate(paras):
-        texts.append(p)
-        metas.append({"source": source, "chunk_id": i, "text": p, "doc_id": doc_id})
-    ids = add_texts(texts, metas)
+        ids = await run_in_threadpool(_add_raw_text, raw_text, doc_id)
     return {"added_ids": ids, "num_added": len(ids)}
 
+def _add_chunks(chunks, source: str, doc_id: Optional[int]) -> List[int]:
+    return add_texts([c.text for c in chunks], [c.to_metadata(source, doc_id) for c in chunks])
+
+def _add_file(path: str, ext: str, digest: str, source: str, doc_id: Optional[int]) -> List[int]:
+    pages = extract_cached(path, ext, digest)["pages"]
+    return _add_chunks(chunk_pages(enumerate(pages, start=1)), source, doc_id)
+
+def _add_raw_text(raw_text: str, doc_id: Optional[int]) -> List[int]:
+    return _add_chunks(chunk_text(clean_text(raw_text, preserve_structure=True)), "raw_text", doc_id)
+
 @router.post("/qa")
-def qa_endpoint(question: str = Body(...), doc_id: Optional[int] = Body(None), top_k: int = Query(5)):
+def qa_endpoint(question: str = Body(...), doc_id: Optional[int] = Body(None),
+                doc_ids: Optional[List[int]] = Body(None), source: Optional[str] = Body(None),
+                top_k: int = Query(5),
+                nprobe: Optional[int] = Query(None, description="IVF lists to probe (ANN index only)"),
+                ef_search: Optional[int] = Query(None, description="HNSW search depth (ANN index only)")):
     """
-    Ask a question — optionally restrict search to one document's embeddings.
+    Ask a question — optionally restrict retrieval to some documents (doc_id / doc_ids)
+    or to one source filename. The filter is applied inside the vector search.
     """
-    # Optional: filter embeddings by doc_id before retrieval
-    results = retrieve_and_answer(question, top_k=top_k)
     if doc_id is not None:
-        results["sources"] = [src for src in results["sources"] if src["metadata"].get("doc_id") == doc_id]
-    return results
+        doc_ids = (doc_ids or []) + [doc_id]
+    return retrieve_and_answer(question, top_k=top_k, nprobe=nprobe, ef_search=ef_search,
+                               doc_ids=doc_ids, source=source)
+
+@router.post("/qa/batch")
+def qa_batch_endpoint(questions: List[Any] = Body(..., embed=True), top_k: int = Query(5),
+                      nprobe: Optional[int] = Query(None, description="IVF lists to probe (ANN index only)"),
+                      ef_search: Optional[int] = Query(None, description="HNSW search depth (ANN index only)")):
+    """
+    Answer many questions in one call. Each item is a question string or
+    {"question": ..., "doc_id"/"doc_ids": ..., "source": ...} with its own scope.
+    Returns {"results": [{"question", "answer", "sources"}, ...]} in input order.
+    """
+    if not questions:
+        return {"results": []}
+    if len(questions) > QA_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {QA_BATCH_MAX} questions per batch")
+    items = []
+    for q in questions:
+        if isinstance(q, str):
+            q = {"question": q}
+        if not isinstance(q, dict) or not isinstance(q.get("question"), str) or not q["question"].strip():
+            raise HTTPException(status_code=400, detail="Each item needs a non-empty 'question'")
+        doc_ids = q.get("doc_ids")
+        if q.get("doc_id") is not None:
+            doc_ids = (doc_ids or []) + [q["doc_id"]]
+        items.append({"question": q["question"], "doc_ids": doc_ids, "source": q.get("source")})
+
+    answers = answer_batch(items, top_k=top_k, nprobe=nprobe, ef_search=ef_search)
+    return {"results": [{"question": item["question"], **ans} for item, ans in zip(items, answers)]}
+
+@router.post("/qa/stream")
+def qa_stream_endpoint(question: str = Body(...), doc_id: Optional[int] = Body(None),
+                       doc_ids: Optional[List[int]] = Body(None), source: Optional[str] = Body(None),
+                       top_k: int = Query(5),
+                       nprobe: Optional[int] = Query(None, description="IVF lists to probe (ANN index only)"),
+                       ef_search: Optional[int] = Query(None, description="HNSW search depth (ANN index only)")):
+    """
+    /qa as Server-Sent Events: a `sources` event, `token` events as the answer is
+    generated, then `done` with the full answer.
+    """
+    if doc_id is not None:
+        doc_ids = (doc_ids or []) + [doc_id]
+    return _sse(stream_answer(question, top_k=top_k, nprobe=nprobe, ef_search=ef_search,
+                              doc_ids=doc_ids, source=source))
 
 
 @router.post("/embeddings/clear")
@@ -96,7 +216,9 @@ async def embeddings_clear():
     return {"cleared": True}
 
 @router.get("/summary/{doc_id}")
-def get_summary(doc_id: int):
+def get_summary(doc_id: int, mode: str = "abstractive",
+                sentences: int = Query(EXTRACTIVE_SENTENCES, ge=1, le=100)):
+    _check_mode(mode)
     db = SessionLocal()
     try:
         doc = db.query(Document).filter(Document.id == doc_id).first()
@@ -104,19 +226,29 @@ def get_summary(doc_id: int):
             raise HTTPException(status_code=404, detail="Document not found")
         if not doc.text:
             raise HTTPException(status_code=400, detail="Document has no text")
-
         text = doc.text.strip()
-        max_chunk_size = 1500  # chars per chunk for summarization
-        if len(text) > max_chunk_size:
-            chunks = [text[i:i+max_chunk_size] for i in range(0, len(text), max_chunk_size)]
-            summaries = [summarize_text(c, max_length=500, min_length=50) for c in chunks]
-            summary = " ".join(summaries)
-        else:
-            summary = summarize_text(text, max_length=500, min_length=50)
-
-        return {"summary": summary}
     finally:
         db.close()
+    if mode == "extractive":
+        return extractive_summary(text, sentences)
+    # stored after the first call (or at ingestion); otherwise a hierarchical summary of the text
+    return document_summary(doc_id, text, prefilter=mode == "hybrid")
+
+
+@router.get("/summary/{doc_id}/sections")
+def get_section_summaries(doc_id: int, per_section_max: int = 120, mode: str = "abstractive",
+                          sentences: int = Query(2, ge=1, le=20)):
+    _check_mode(mode, ("abstractive", "extractive"))
+    db = SessionLocal()
+    try:
+        if not db.query(Document.id).filter(Document.id == doc_id).first():
+            raise HTTPException(status_code=404, detail="Document not found")
+        sections = stored_sections(db, doc_id)
+    finally:
+        db.close()
+    if mode == "extractive":
+        return {"section_summaries": _extractive_sections(sections, sentences)}
+    return {"section_summaries": section_summaries(sections, per_section_max, doc_id=doc_id)}
 
 
 from app.services.visualization import hierarchy_to_mermaid
@@ -139,50 +271,10 @@ def get_flowchart(doc_id: int):
         db.close()
 
 from fastapi import status
-from app.services.embeddings_store import _metadata, save_index, _init_index
-import faiss
+from app.services.documents import delete_document as delete_document_record
 
 @router.delete("/documents/{doc_id}", status_code=status.HTTP_200_OK)
 def delete_document(doc_id: int):
-    db = SessionLocal()
-    try:
-        # Get document
-        doc = db.query(Document).filter(Document.id == doc_id).first()
-        if not doc:
-            raise HTTPException(status_code=404, detail="Document not found")
-
-        # Remove file from uploads folder
-        if doc.original_path and os.path.exists(doc.original_path):
-            os.remove(doc.original_path)
-
-        # Remove embeddings related to this doc_id
-        _init_index(384)  # Assuming MiniLM 384-dim; adjust if needed
-        ids_to_remove = [idx for idx, md in _metadata.items() if md.get("doc_id") == doc_id]
-        if ids_to_remove:
-            # Create a mask for vectors to keep
-            total_ids = list(range(len(_metadata)))
-            keep_ids = [i for i in total_ids if i not in ids_to_remove]
-            if keep_ids:
-                new_index = faiss.IndexFlatIP(_index.d)
-                new_metadata = {}
-                vectors = faiss.vector_to_array(_index.xb).reshape(-1, _index.d)
-                for new_id, old_id in enumerate(keep_ids):
-                    new_index.add(vectors[old_id:old_id+1])
-                    new_metadata[new_id] = _metadata[old_id]
-                _index.reset()
-                _index.add(new_index.reconstruct_n(0, len(keep_ids)))
-                _metadata.clear()
-                _metadata.update(new_metadata)
-                save_index()
-            else:
-                # No embeddings remain → clear store
-                from app.services.embeddings_store import clear_store
-                clear_store()
-
-        # Delete document from DB
-        db.delete(doc)
-        db.commit()
-
-        return {"deleted": True, "doc_id": doc_id}
-    finally:
-        db.close()
+    if not delete_document_record(doc_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"deleted": True, "doc_id": doc_id}
@@ -1,19 +1,21 @@
-from fastapi import APIRouter, File, UploadFile, Body
+from fastapi import APIRouter, File, UploadFile, Body, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional, Dict, Any
 import os
 
-from app.utils.file_handler import save_file
-from app.services.extractor import extract_and_clean
+from app.utils.file_handler import save_upload
+from app.services.extraction_cache import extract_and_clean_cached
 from app.services.structure import detect_sections, sections_to_json
 from app.services.nlp import split_sentences, top_keywords
+from app.services.documents import persist_sections
+from app.services import embedding_service
 
 # DB
 from app.db.database import SessionLocal, engine, Base
-from app.db.models import Document, Section
+from app.db.models import Document
 
 # ML
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import hdbscan
 from sklearn.feature_extraction.text import TfidfVectorizer
 
@@ -22,25 +24,16 @@ router = APIRouter(prefix="/structure", tags=["Structure & Topics"])
 # Create tables if not exist
 Base.metadata.create_all(bind=engine)
 
-# Lazy global model
-_model: Optional[SentenceTransformer] = None
-def get_model():
-    global _model
-    if _model is None:
-        _model = SentenceTransformer("all-MiniLM-L6-v2")
-    return _model
-
 @router.post("/parse")
 async def parse_structure(file: UploadFile = File(...), save: bool = False):
     """
     Upload a file, extract text, detect headings/sections, return hierarchy JSON.
     Optional: ?save=true to persist into SQLite.
     """
-    file_bytes = await file.read()
-    path = save_file(file_bytes, file.filename)
+    path, digest = await save_upload(file)
     ext = os.path.splitext(file.filename)[-1].replace(".", "")
 
-    text = extract_and_clean(path, ext)
+    text = extract_and_clean_cached(path, ext, digest)
     nodes = detect_sections(text)
     payload = sections_to_json(nodes)
 
@@ -49,17 +42,7 @@ async def parse_structure(file: UploadFile = File(...), save: bool = False):
         try:
             doc = Document(filename=file.filename, original_path=path, text=text)
             db.add(doc); db.flush()
-
-            def persist(node, parent_id=None):
-                s = Section(document_id=doc.id, title=node["title"], level=node["level"],
-                            start_line=node["start_line"], end_line=node["end_line"],
-                            content=node["content"], parent_id=parent_id)
-                db.add(s); db.flush()
-                for ch in node["children"]:
-                    persist(ch, parent_id=s.id)
-
-            for root in payload:
-                persist(root, None)
+            persist_sections(db, doc.id, payload)
             db.commit()
             return {"document_id": doc.id, "hierarchy": payload}
         finally:
@@ -73,7 +56,6 @@ async def semantic_clusters(
     raw_text: Optional[str] = Body(default=None),
     min_cluster_size: int = 8,
     min_samples: Optional[int] = None,
-    batch_size: int = 128,
     max_sentences: Optional[int] = 2000
 ):
     """
@@ -85,10 +67,9 @@ async def semantic_clusters(
         raise HTTPException(status_code=400, detail="Provide a file or raw_text")
 
     if file is not None:
-        file_bytes = await file.read()
-        path = save_file(file_bytes, file.filename)
+        path, digest = await save_upload(file)
         ext = os.path.splitext(file.filename)[-1].replace(".", "")
-        text = extract_and_clean(path, ext)
+        text = extract_and_clean_cached(path, ext, digest)
     else:
         text = raw_text
 
@@ -100,14 +81,9 @@ async def semantic_clusters(
     if max_sentences and len(sents) > max_sentences:
         sents = sents[:max_sentences]
 
-    model = get_model()
-    emb = model.encode(
-        sents,
-        batch_size=batch_size,
-        convert_to_numpy=True,
-        normalize_embeddings=True,
-        device="cuda" if torch.cuda.is_available() else "cpu"
-    )
+    # shared model; the service batches these with other callers' texts. encode() waits on
+    # the worker, so it must not hold the event loop meanwhile
+    emb = await run_in_threadpool(embedding_service.encode, sents)
 
     clusterer = hdbscan.HDBSCAN(
         min_cluster_size=min_cluster_size,
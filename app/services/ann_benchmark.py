@@ -0,0 +1,141 @@
+# app/services/ann_benchmark.py
+"""
+Recall@k vs. latency report for the ANN index types against the exact flat baseline.
+
+    python -m app.services.ann_benchmark                    # vectors from the live store
+    python -m app.services.ann_benchmark --synthetic 200000 # clustered random vectors
+"""
+import os
+import json
+import argparse
+import time
+from typing import List, Dict, Any, Sequence
+import faiss
+import numpy as np
+from app.services import ann_index
+
+
+def synthetic_corpus(n: int, dim: int = 384, n_clusters: int = 200, seed: int = 0) -> np.ndarray:
+    """Normalized vectors drawn around random centers, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype("float32")
+    x = centers[rng.integers(0, n_clusters, n)] + 0.5 * rng.standard_normal((n, dim)).astype("float32")
+    faiss.normalize_L2(x)
+    return x
+
+
+def store_corpus() -> np.ndarray:
+    """
+    All vectors of the store on disk: the last checkpoint plus the WAL segments after it.
+    Everything is opened read-only (no WAL repair, checkpointer or promotion), so this is
+    safe to run next to a live server. IVF-PQ checkpoints yield their decoded (lossy) vectors.
+    """
+    from app.services import embeddings_store as es
+    vectors: Dict[int, np.ndarray] = {}
+    dim = None
+    if os.path.exists(es.INDEX_PATH):
+        index = faiss.read_index(es.INDEX_PATH)
+        dim = index.d
+        if isinstance(index, faiss.IndexIVF):
+            index.make_direct_map()  # this private copy only; lets IVF reconstruct by id
+            ids = ann_index.stored_ids(index)
+            stored = index.reconstruct_batch(ids) if len(ids) else np.zeros((0, dim), dtype="float32")
+        elif isinstance(index, faiss.IndexIDMap2):
+            ids = ann_index.stored_ids(index)
+            stored = index.index.reconstruct_n(0, index.ntotal)  # storage is in id_map order
+        else:  # legacy positional index: positions are the ids
+            ids = np.arange(index.ntotal, dtype="int64")
+            stored = index.reconstruct_n(0, index.ntotal)
+        vectors = dict(zip(ids.tolist(), stored))
+        del index
+    if os.path.exists(es.STATE_PATH):
+        with open(es.STATE_PATH, "r") as f:
+            for vid in json.load(f).get("tombstones", []):
+                vectors.pop(vid, None)
+    for _, path in es._segments():
+        try:
+            for op, start_id, vecs, metas in es._read_records(path, repair=False):
+                if op == es._OP_ADD and len(vecs) and (dim is None or vecs.shape[1] == dim):
+                    dim = vecs.shape[1]
+                    vectors.update(zip(range(start_id, start_id + len(vecs)), vecs))
+                elif op == es._OP_DELETE:
+                    for vid in metas["ids"]:
+                        vectors.pop(vid, None)
+        except FileNotFoundError:
+            continue  # folded into a checkpoint meanwhile
+    if not vectors:
+        return np.zeros((0, 0), dtype="float32")
+    return np.ascontiguousarray(np.stack([vectors[vid] for vid in sorted(vectors)]), dtype="float32")
+
+
+def _recall(found: np.ndarray, truth: np.ndarray, k: int) -> float:
+    hits = sum(len(set(f[:k]) & set(t[:k])) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def run_benchmark(vectors: np.ndarray, n_queries: int = 500, k: int = 10,
+                  kinds: Sequence[str] = ("hnsw", "ivf_flat", "ivf_pq"),
+                  nprobes: Sequence[int] = (1, 4, 16, 64),
+                  ef_searches: Sequence[int] = (16, 64, 256)) -> List[Dict[str, Any]]:
+    """
+    Hold out n_queries vectors as queries, index the rest with each kind and
+    report recall@k against exact search plus mean latency per query.
+    """
+    rng = np.random.default_rng(0)
+    perm = rng.permutation(len(vectors))
+    queries = np.ascontiguousarray(vectors[perm[:n_queries]])
+    base = np.ascontiguousarray(vectors[perm[n_queries:]])
+    ids = np.arange(len(base), dtype="int64")
+    dim = base.shape[1]
+
+    rows = []
+    flat = faiss.IndexFlatIP(dim)
+    flat.add(base)
+    t0 = time.perf_counter()
+    _, truth = flat.search(queries, k)
+    rows.append({"type": "flat", "param": "-", "recall": 1.0, "build_s": 0.0,
+                 "ms_per_query": 1000 * (time.perf_counter() - t0) / len(queries)})
+
+    for kind in kinds:
+        t0 = time.perf_counter()
+        index = ann_index.build_index(kind, dim, len(base))
+        index.train(ann_index.train_sample(base))
+        index.add_with_ids(base, ids)
+        build_s = time.perf_counter() - t0
+        sweep = [("efSearch", v, {"ef_search": v}) for v in ef_searches] if kind == "hnsw" \
+            else [("nprobe", v, {"nprobe": v}) for v in nprobes]
+        for name, value, kwargs in sweep:
+            params = ann_index.search_params(index, **kwargs)
+            t0 = time.perf_counter()
+            _, found = index.search(queries, k, params=params)
+            elapsed = time.perf_counter() - t0
+            rows.append({"type": kind, "param": f"{name}={value}", "recall": _recall(found, truth, k),
+                         "build_s": build_s, "ms_per_query": 1000 * elapsed / len(queries)})
+    return rows
+
+
+def format_report(rows: List[Dict[str, Any]], k: int) -> str:
+    lines = [f"{'index':<10} {'param':<14} {'recall@' + str(k):>10} {'ms/query':>10} {'build s':>9}"]
+    for r in rows:
+        lines.append(f"{r['type']:<10} {r['param']:<14} {r['recall']:>10.4f} "
+                     f"{r['ms_per_query']:>10.3f} {r['build_s']:>9.2f}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=0, help="benchmark N synthetic vectors instead of the store")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    vectors = synthetic_corpus(args.synthetic, args.dim) if args.synthetic else store_corpus()
+    if len(vectors) <= args.queries:
+        raise SystemExit(f"Need more than {args.queries} vectors, have {len(vectors)}")
+    rows = run_benchmark(vectors, n_queries=args.queries, k=args.k)
+    print(format_report(rows, args.k))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# app/services/ann_index.py
+import os
+import math
+from typing import Optional
+import faiss
+import numpy as np
+
+# The store starts as an exact flat index and is promoted to INDEX_TYPE once it holds
+# ANN_PROMOTE_THRESHOLD vectors. INDEX_TYPE=flat disables promotion.
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+INDEX_TYPE = os.environ.get("INDEX_TYPE", "ivf_flat").lower()
+ANN_PROMOTE_THRESHOLD = int(os.environ.get("ANN_PROMOTE_THRESHOLD", "50000"))
+ANN_TRAIN_SAMPLE = int(os.environ.get("ANN_TRAIN_SAMPLE", "100000"))
+
+HNSW_M = int(os.environ.get("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.environ.get("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.environ.get("HNSW_EF_SEARCH", "64"))
+IVF_NLIST = int(os.environ.get("IVF_NLIST", "0"))  # 0 -> ~4*sqrt(n)
+IVF_NPROBE = int(os.environ.get("IVF_NPROBE", "16"))
+PQ_M = int(os.environ.get("PQ_M", "16"))          # sub-quantizers; must divide the dimension
+PQ_NBITS = int(os.environ.get("PQ_NBITS", "8"))
+
+if INDEX_TYPE not in INDEX_TYPES:
+    raise ValueError(f"INDEX_TYPE must be one of {INDEX_TYPES}, got {INDEX_TYPE!r}")
+
+
+def default_nlist(n: int) -> int:
+    if IVF_NLIST:
+        return IVF_NLIST
+    # ~4*sqrt(n) lists, but keep >= 39 training points per centroid
+    return max(1, min(int(4 * math.sqrt(max(n, 1))), n // 39))
+
+
+def factory_string(kind: str, dim: int, n: int) -> str:
+    # IVF stores external ids natively; flat/HNSW need an IDMap2 wrapper
+    if kind == "flat":
+        return "IDMap2,Flat"
+    if kind == "hnsw":
+        return f"IDMap2,HNSW{HNSW_M}"
+    if kind == "ivf_flat":
+        return f"IVF{default_nlist(n)},Flat"
+    if kind == "ivf_pq":
+        if dim % PQ_M:
+            raise ValueError(f"PQ_M={PQ_M} does not divide dimension {dim}")
+        return f"IVF{default_nlist(n)},PQ{PQ_M}x{PQ_NBITS}"
+    raise ValueError(f"Unknown index type {kind!r}")
+
+
+def _inner(index):
+    return faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+
+
+def build_index(kind: str, dim: int, n: int = 0):
+    """Empty (untrained) index of the given kind with 64-bit ids and inner-product metric."""
+    index = faiss.index_factory(dim, factory_string(kind, dim, n), faiss.METRIC_INNER_PRODUCT)
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        inner.hnsw.efSearch = HNSW_EF_SEARCH
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = IVF_NPROBE
+    return index
+
+
+def train_sample(vectors: np.ndarray, size: int = ANN_TRAIN_SAMPLE, seed: int = 0) -> np.ndarray:
+    if len(vectors) <= size:
+        return vectors
+    rng = np.random.default_rng(seed)
+    return vectors[rng.choice(len(vectors), size, replace=False)]
+
+
+def index_kind(index) -> str:
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def supports_remove(index) -> bool:
+    return index_kind(index) != "hnsw"
+
+
+def supports_reconstruct(index) -> bool:
+    # IVF would need a direct map, which costs memory and slows remove_ids
+    return isinstance(index, faiss.IndexIDMap2)
+
+
+def stored_ids(index) -> np.ndarray:
+    """All ids currently held by the index."""
+    if isinstance(index, faiss.IndexIDMap2):
+        return faiss.vector_to_array(index.id_map).copy()
+    invlists = index.invlists
+    parts = []
+    for list_no in range(index.nlist):
+        size = invlists.list_size(list_no)
+        if size:
+            parts.append(faiss.rev_swig_ptr(invlists.get_ids(list_no), size).copy())
+    return np.concatenate(parts) if parts else np.zeros(0, dtype="int64")
+
+
+def search_params(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                  sel=None, all_lists: bool = False):
+    """
+    Per-query search parameters for the index kind (None when defaults suffice).
+    all_lists makes IVF probe every list: with an include-selector, matching vectors
+    outside the nprobe nearest lists would otherwise never be scored.
+    """
+    kind = index_kind(index)
+    if kind in ("ivf_flat", "ivf_pq"):
+        return faiss.SearchParametersIVF(nprobe=index.nlist if all_lists else (nprobe or IVF_NPROBE), sel=sel)
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=ef_search or HNSW_EF_SEARCH, sel=sel)
+    return faiss.SearchParameters(sel=sel) if sel is not None else None
+
+
+def should_promote(index) -> bool:
+    return (INDEX_TYPE != "flat" and index_kind(index) == "flat"
+            and index.ntotal >= ANN_PROMOTE_THRESHOLD)
@@ -0,0 +1,63 @@
+# app/services/answer_cache.py
+import os
+import copy
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+import numpy as np
+
+# Generated answers keyed by question embedding. A new question reuses an answer when
+# its cosine similarity to a cached question is >= ANSWER_CACHE_THRESHOLD, the retrieval
+# scope (filters, top_k, ...) is identical and the index version has not moved since.
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE", "1").lower() in ("1", "true", "yes")
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+_lock = threading.Lock()
+_entries: "OrderedDict[int, tuple]" = OrderedDict()  # entry id -> (scope, version, emb, answer)
+_next_entry = 0
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def lookup(q_emb: np.ndarray, scope: Hashable, version: int) -> Optional[Dict[str, Any]]:
+    """Cached answer of the most similar question in the same scope and version, if close enough."""
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    q = np.asarray(q_emb, dtype="float32").reshape(-1)
+    with _lock:
+        candidates = [(eid, e[2]) for eid, e in _entries.items() if e[0] == scope and e[1] == version]
+        if candidates:
+            sims = np.stack([emb for _, emb in candidates]) @ q
+            best = int(np.argmax(sims))
+            if sims[best] >= ANSWER_CACHE_THRESHOLD:
+                eid = candidates[best][0]
+                _entries.move_to_end(eid)
+                _stats["hits"] += 1
+                return copy.deepcopy(_entries[eid][3])
+        _stats["misses"] += 1
+    return None
+
+
+def put(q_emb: np.ndarray, scope: Hashable, version: int, answer: Dict[str, Any]):
+    global _next_entry
+    if not ANSWER_CACHE_ENABLED or ANSWER_CACHE_SIZE <= 0:
+        return
+    q = np.array(q_emb, dtype="float32").reshape(-1)
+    with _lock:
+        # entries from older index versions can never match again
+        for eid in [eid for eid, e in _entries.items() if e[1] < version]:
+            del _entries[eid]
+            _stats["evictions"] += 1
+        _entries[_next_entry] = (scope, version, q, copy.deepcopy(answer))
+        _next_entry += 1
+        while len(_entries) > ANSWER_CACHE_SIZE:
+            _entries.popitem(last=False)
+            _stats["evictions"] += 1
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {"enabled": ANSWER_CACHE_ENABLED, "size": len(_entries), "max_size": ANSWER_CACHE_SIZE,
+                "threshold": ANSWER_CACHE_THRESHOLD, **_stats,
+                "hit_ratio": round(_stats["hits"] / lookups, 4) if lookups else None}
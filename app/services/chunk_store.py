@@ -0,0 +1,110 @@
+# app/services/chunk_store.py
+import json
+from typing import List, Dict, Any, Iterable, Optional
+from sqlalchemy import select, insert, delete, func, case
+from app.db.database import engine, Base, add_missing_columns
+from app.db.models import Chunk, Document
+
+# Chunk metadata lives in SQLite next to Document/Section, keyed by vector id.
+# Chunk text is not duplicated: it is sliced out of Document.text by offsets,
+# unless the chunk was added without a backing document (then `text` is stored).
+_chunks = Chunk.__table__
+_documents = Document.__table__
+_COLUMNS = {"doc_id": "doc_id", "chunk_id": "chunk_id", "source": "source", "page": "page",
+            "start": "start_offset", "end": "end_offset", "text": "text", "section_id": "section_id"}
+
+Base.metadata.create_all(bind=engine)
+add_missing_columns(_chunks)  # section_id on databases created before it existed
+
+
+def _to_row(vector_id: int, md: Dict[str, Any]) -> Dict[str, Any]:
+    md = md or {}
+    row = {"vector_id": int(vector_id)}
+    for key, col in _COLUMNS.items():
+        row[col] = md.get(key)
+    if row["chunk_id"] is None:
+        row["chunk_id"] = 0
+    extra = {k: v for k, v in md.items() if k not in _COLUMNS}
+    row["extra"] = json.dumps(extra) if extra else None
+    return row
+
+
+def insert_chunks(vector_ids: Iterable[int], metadatas: Iterable[Dict[str, Any]], conn=None):
+    """Insert metadata rows; already present vector ids are left untouched (safe for WAL replay)."""
+    rows = [_to_row(vid, md) for vid, md in zip(vector_ids, metadatas)]
+    if not rows:
+        return
+    stmt = insert(_chunks).prefix_with("OR IGNORE")
+    if conn is not None:
+        conn.execute(stmt, rows)
+    else:
+        with engine.begin() as c:
+            c.execute(stmt, rows)
+
+
+def delete_chunks(vector_ids: List[int]):
+    if not vector_ids:
+        return
+    with engine.begin() as conn:
+        for i in range(0, len(vector_ids), 500):  # stay under SQLite's bound-parameter limit
+            conn.execute(delete(_chunks).where(_chunks.c.vector_id.in_(vector_ids[i:i + 500])))
+
+
+def clear_chunks():
+    with engine.begin() as conn:
+        conn.execute(delete(_chunks))
+
+
+def vector_ids_for_doc(doc_id: int) -> List[int]:
+    with engine.connect() as conn:
+        return [r[0] for r in conn.execute(select(_chunks.c.vector_id).where(_chunks.c.doc_id == doc_id))]
+
+
+def vector_ids_matching(doc_ids: Optional[List[int]] = None, source: Optional[str] = None) -> List[int]:
+    """Vector ids of the chunks that pass the filters (uses the doc_id/source indexes)."""
+    c = _chunks.c
+    stmt = select(c.vector_id)
+    if doc_ids is not None:
+        stmt = stmt.where(c.doc_id.in_(list(doc_ids)))
+    if source is not None:
+        stmt = stmt.where(c.source == source)
+    with engine.connect() as conn:
+        return [r[0] for r in conn.execute(stmt)]
+
+
+def max_vector_id() -> int:
+    with engine.connect() as conn:
+        return conn.execute(select(func.max(_chunks.c.vector_id))).scalar() or -1
+
+
+def fetch(vector_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Metadata (including text) for just these vector ids."""
+    if not vector_ids:
+        return {}
+    c = _chunks.c
+    text = case(
+        (c.text.isnot(None), c.text),
+        else_=func.substr(_documents.c.text, c.start_offset + 1, c.end_offset - c.start_offset),
+    ).label("resolved_text")
+    stmt = (select(c.vector_id, c.doc_id, c.chunk_id, c.source, c.page, c.start_offset, c.end_offset,
+                   c.section_id, c.extra, text)
+            .select_from(_chunks.outerjoin(_documents, _documents.c.id == c.doc_id))
+            .where(c.vector_id.in_([int(v) for v in vector_ids])))
+    out = {}
+    with engine.connect() as conn:
+        for r in conn.execute(stmt):
+            md = json.loads(r.extra) if r.extra else {}
+            md.update({"doc_id": r.doc_id, "chunk_id": r.chunk_id, "source": r.source, "page": r.page,
+                       "start": r.start_offset, "end": r.end_offset, "section_id": r.section_id,
+                       "text": r.resolved_text or ""})
+            out[r.vector_id] = md
+    return out
+
+
+def import_legacy(metadata: Dict[int, Dict[str, Any]], batch_size: int = 1000):
+    """One-off import of the old pickled {vector_id: metadata} dict."""
+    items = list(metadata.items())
+    with engine.begin() as conn:
+        for i in range(0, len(items), batch_size):
+            batch = items[i:i + batch_size]
+            insert_chunks([vid for vid, _ in batch], [md for _, md in batch], conn=conn)
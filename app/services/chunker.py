@@ -0,0 +1,138 @@
+# app/services/chunker.py
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+# Chunks are bounded by the embedding model's tokenizer; CHUNK_MAX_TOKENS can only
+# lower the model's own limit. Overlap is carried over as whole sentences.
+CHUNK_MAX_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", "0"))  # 0 -> model limit
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", "32"))
+
+# sentence ends or paragraph breaks; single newlines (wrapped lines) stay inside a unit
+_UNIT_BOUNDARY = re.compile(r'(?<=[\.!?])\s+|\n\s*\n')
+
+@dataclass
+class Chunk:
+    chunk_id: int
+    text: str
+    start: int          # char offset in the document text
+    end: int
+    page: Optional[int] = None
+    n_tokens: int = 0
+
+    def to_metadata(self, source: str, doc_id: Optional[int], include_text: bool = True) -> Dict[str, Any]:
+        # without text the chunk store slices it out of Document.text by offsets
+        md = {"source": source, "chunk_id": self.chunk_id, "doc_id": doc_id,
+              "page": self.page, "start": self.start, "end": self.end}
+        if include_text:
+            md["text"] = self.text
+        return md
+
+
+def _tokenizer_and_limit(tokenizer=None, max_tokens: Optional[int] = None):
+    if tokenizer is None:
+        from app.services.embedding_service import get_model, get_tokenizer
+        model = get_model()
+        tokenizer = get_tokenizer()  # not model.tokenizer: that one is busy in the encode worker
+        model_limit = model.max_seq_length - 2  # room for [CLS]/[SEP]
+    else:
+        model_limit = tokenizer.model_max_length - 2
+    limit = max_tokens or CHUNK_MAX_TOKENS or model_limit
+    return tokenizer, min(limit, model_limit)
+
+
+def _sentence_spans(text: str) -> List[Tuple[int, int]]:
+    spans, pos = [], 0
+    for m in _UNIT_BOUNDARY.finditer(text):
+        if m.start() > pos:
+            spans.append((pos, m.start()))
+        pos = m.end()
+    if pos < len(text):
+        spans.append((pos, len(text)))
+    return spans
+
+
+def _split_long(text: str, start: int, end: int, tokenizer, budget: int, overlap: int):
+    """Window a single over-long sentence by tokens, mapping back to char offsets."""
+    enc = tokenizer(text[start:end], add_special_tokens=False, return_offsets_mapping=True)
+    offsets = enc["offset_mapping"]
+    step = max(budget - overlap, 1)
+    units = []
+    for i in range(0, len(offsets), step):
+        window = offsets[i:i + budget]
+        units.append((start + window[0][0], start + window[-1][1], len(window)))
+        if i + budget >= len(offsets):
+            break
+    return units
+
+
+def chunk_text(text: str, max_tokens: Optional[int] = None, overlap: Optional[int] = None,
+               page: Optional[int] = None, base_offset: int = 0, first_id: int = 0,
+               tokenizer=None) -> List[Chunk]:
+    """
+    Greedily pack whole sentences into chunks of at most max_tokens tokens.
+    Consecutive chunks share up to `overlap` tokens of trailing sentences.
+    Offsets are relative to the document (base_offset is where `text` starts).
+    """
+    tokenizer, budget = _tokenizer_and_limit(tokenizer, max_tokens)
+    overlap = CHUNK_OVERLAP_TOKENS if overlap is None else overlap
+    overlap = min(overlap, budget // 2)
+
+    spans = _sentence_spans(text)
+    if not spans:
+        return []
+    lengths = [len(ids) for ids in
+               tokenizer([text[s:e] for s, e in spans], add_special_tokens=False)["input_ids"]]
+    units = []
+    for (s, e), n in zip(spans, lengths):
+        if n > budget:
+            units.extend(_split_long(text, s, e, tokenizer, budget, overlap))
+        else:
+            units.append((s, e, n))
+
+    groups, cur, cur_tok = [], [], 0
+    for u in units:
+        if cur and cur_tok + u[2] > budget:
+            groups.append(cur)
+            carry, carry_tok = [], 0
+            for v in reversed(cur):
+                if carry_tok + v[2] > overlap:
+                    break
+                carry.insert(0, v)
+                carry_tok += v[2]
+            cur, cur_tok = carry, carry_tok
+            while cur and cur_tok + u[2] > budget:
+                cur_tok -= cur.pop(0)[2]
+        cur.append(u)
+        cur_tok += u[2]
+    if cur:
+        groups.append(cur)
+
+    chunks = []
+    for g in groups:
+        s, e = g[0][0], g[-1][1]
+        chunks.append(Chunk(chunk_id=first_id + len(chunks), text=text[s:e], start=base_offset + s,
+                            end=base_offset + e, page=page, n_tokens=sum(u[2] for u in g)))
+    return chunks
+
+
+def chunk_pages(pages: Iterable[Tuple[int, str]], max_tokens: Optional[int] = None,
+                overlap: Optional[int] = None, separator: str = "\n\n", tokenizer=None) -> List[Chunk]:
+    """
+    Chunk (page_no, cleaned text) pairs page by page. Offsets match the document
+    text built by joining the non-empty pages with `separator` (extractor.join_pages).
+    """
+    chunks: List[Chunk] = []
+    offset = 0
+    first = True
+    for page_no, text in pages:
+        if not text:
+            continue
+        if not first:
+            offset += len(separator)
+        first = False
+        chunks.extend(chunk_text(text, max_tokens, overlap, page=page_no, base_offset=offset,
+                                 first_id=len(chunks), tokenizer=tokenizer))
+        offset += len(text)
+    return chunks
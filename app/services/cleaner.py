@@ -1,7 +1,21 @@
 import re
 
-def clean_text(text: str) -> str:
-    """Basic text cleaning."""
+_HSPACE = re.compile(r'[ \t\f\v\u00a0]+')
+_SPACE_AROUND_NL = re.compile(r' *\n *')
+_EXTRA_BLANK_LINES = re.compile(r'\n{3,}')
+
+def clean_text(text: str, preserve_structure: bool = False) -> str:
+    """Basic text cleaning. With preserve_structure, line and paragraph breaks are kept."""
+    if preserve_structure:
+        return normalize_text(text)
     text = re.sub(r'\s+', ' ', text)       # remove extra spaces
     text = re.sub(r'\n+', '\n', text)      # normalize newlines
     return text.strip()
+
+def normalize_text(text: str) -> str:
+    """Collapse horizontal whitespace but keep single newlines and blank-line paragraph breaks."""
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    text = _HSPACE.sub(' ', text)
+    text = _SPACE_AROUND_NL.sub('\n', text)
+    text = _EXTRA_BLANK_LINES.sub('\n\n', text)   # at most one blank line between paragraphs
+    return text.strip()
@@ -0,0 +1,120 @@
+# app/services/context_builder.py
+import os
+import re
+from typing import List, Dict, Any, Optional, Tuple
+from app.services.nlp import split_sentences
+
+# QA context is packed by tokens, not characters: best-scored passages first, duplicates
+# and near-duplicates (word-shingle Jaccard >= CONTEXT_NEAR_DUP) dropped, and the last
+# passage that doesn't fit trimmed to whole sentences, so the prompt fills but never
+# overflows the generator's encoder.
+CONTEXT_NEAR_DUP = float(os.environ.get("CONTEXT_NEAR_DUP", "0.8"))
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+_FALLBACK_MAX_TOKENS = 512  # tokenizers without a real model_max_length report ~1e30
+
+_WORD = re.compile(r"\w+")
+
+
+def prompt_template(context: str, query: str) -> str:
+    return f"Context:\n{context}\n\nQuestion: {query}\nAnswer concisely:"
+
+
+def _n_tokens(tokenizer, texts: List[str]) -> List[int]:
+    if not texts:
+        return []
+    return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+
+def _shingles(text: str, n: int = 3) -> set:
+    words = _WORD.findall(text.lower())
+    if len(words) < n:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def _is_near_duplicate(shingles: set, kept: List[set], threshold: float) -> bool:
+    for other in kept:
+        inter = len(shingles & other)
+        if not inter:
+            continue
+        # containment counts too: a passage inside a kept one adds nothing
+        if inter / len(shingles | other) >= threshold or inter / min(len(shingles), len(other)) >= 0.95:
+            return True
+    return False
+
+
+def _trim_to_budget(tokenizer, text: str, budget: int) -> str:
+    """Longest prefix of whole sentences that fits in budget tokens ('' if none)."""
+    sentences = split_sentences(text)
+    kept, used = [], 0
+    for sent, n in zip(sentences, _n_tokens(tokenizer, sentences)):
+        extra = n + (1 if kept else 0)  # the joining space
+        if used + extra > budget:
+            break
+        kept.append(sent)
+        used += extra
+    return " ".join(kept)
+
+
+def prompt_limit(tokenizer, max_tokens: Optional[int] = None) -> int:
+    limit = tokenizer.model_max_length
+    if not limit or limit > 100_000:
+        limit = _FALLBACK_MAX_TOKENS
+    return min(limit, max_tokens) if max_tokens else limit
+
+
+def build_context(query: str, hits: List[Dict[str, Any]], tokenizer,
+                  max_tokens: Optional[int] = None,
+                  near_dup: float = CONTEXT_NEAR_DUP) -> Tuple[str, List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Pack hits (highest score first) so the whole prompt is at most max_tokens tokens
+    (default: the tokenizer's model limit). Returns (context, sources used, counters).
+    """
+    limit = prompt_limit(tokenizer, max_tokens)
+    overhead = len(tokenizer(prompt_template("", query))["input_ids"])  # template, question, </s>
+    sep_tokens = _n_tokens(tokenizer, [CONTEXT_SEPARATOR])[0]
+    ordered = sorted(hits, key=lambda h: h.get("score", 0.0), reverse=True)
+
+    candidates, duplicates = [], 0
+    for h in ordered:
+        md = h.get("metadata", {})
+        text = (md.get("text") or md.get("content") or "").strip()
+        if not text:
+            continue
+        shingles = _shingles(text)
+        if _is_near_duplicate(shingles, [c[3] for c in candidates], near_dup):
+            duplicates += 1
+            continue
+        candidates.append((h, md, text, shingles))
+    lengths = _n_tokens(tokenizer, [c[2] for c in candidates])
+
+    def pack(budget: int):
+        parts, sources, used, trimmed = [], [], 0, 0
+        for (h, md, text, _), n in zip(candidates, lengths):
+            room = budget - used - (sep_tokens if parts else 0)
+            if room <= 0:
+                break
+            if n > room:
+                text = _trim_to_budget(tokenizer, text, room)
+                if not text:
+                    continue
+                n = _n_tokens(tokenizer, [text])[0]
+                trimmed += 1
+            used += n + (sep_tokens if parts else 0)
+            parts.append(text)
+            sources.append({"score": h["score"], "metadata": md})
+        return CONTEXT_SEPARATOR.join(parts), sources, trimmed
+
+    # token counts of pieces don't always add up exactly across joins; re-check the
+    # assembled prompt and shrink the budget by the excess until it fits
+    budget = max(limit - overhead, 0)
+    for _ in range(3):
+        context, sources, trimmed = pack(budget)
+        total = len(tokenizer(prompt_template(context, query))["input_ids"])
+        if total <= limit or budget == 0:
+            break
+        budget = max(budget - (total - limit), 0)
+
+    stats = {"candidates": len(hits), "duplicates": duplicates, "used": len(sources),
+             "trimmed": trimmed, "prompt_tokens": total, "limit": limit}
+    return context, sources, stats
@@ -0,0 +1,110 @@
+# app/services/documents.py
+import os
+import bisect
+from typing import List, Dict, Any, Tuple
+from sqlalchemy import insert, select, func, or_, event
+from sqlalchemy.orm import Session
+from app.db.database import SessionLocal
+from app.db.models import Document, Section, IngestionJob
+from app.services.embeddings_store import delete_document_vectors
+from app.services import summary_store
+
+def persist_sections(db: Session, document_id: int, payload: List[Dict[str, Any]]) -> List[Tuple[int, int, int]]:
+    """
+    Persist a sections_to_json() hierarchy for a document, one executemany INSERT per tree
+    depth. Ids are reserved up front from max(id) and assigned explicitly, so each depth
+    knows its parents' ids without RETURNING (which SQLite only orders row by row).
+    Caller owns the transaction (commit/rollback) and must have written in it already
+    (a flushed Document, clear_sections), so SQLite's write lock keeps the ids reserved.
+    Returns (section_id, start_line, end_line) for every section, in document order.
+    """
+    table = Section.__table__
+    next_id = (db.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+    conn = db.connection()
+    inserts = []
+
+    def count_inserts(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("INSERT"):
+            inserts.append(executemany)
+
+    event.listen(conn, "before_cursor_execute", count_inserts)
+    written, depths = [], 0
+    level = [(node, None) for node in payload]
+    try:
+        while level:
+            ids = list(range(next_id, next_id + len(level)))
+            next_id += len(level)
+            rows = [{"id": sid, "document_id": document_id, "title": node["title"], "level": node["level"],
+                     "start_line": node["start_line"], "end_line": node["end_line"],
+                     "content": node["content"], "parent_id": parent_id}
+                    for (node, parent_id), sid in zip(level, ids)]
+            db.execute(insert(table), rows)
+            depths += 1
+            written.extend((sid, node["start_line"], node["end_line"]) for (node, _), sid in zip(level, ids))
+            level = [(child, sid) for (node, _), sid in zip(level, ids) for child in node["children"]]
+    finally:
+        event.remove(conn, "before_cursor_execute", count_inserts)
+    if len(inserts) > depths:
+        # the writer is only "bulk" while each depth stays one statement
+        print(f"[WARN] persist_sections sent {len(inserts)} INSERT statements for {depths} tree depths")
+    return sorted(written, key=lambda w: w[1])
+
+def section_spans(text: str, sections: List[Tuple[int, int, int]]) -> List[Tuple[int, int, int]]:
+    """(section_id, start_line, end_line) -> (section_id, start_char, end_char) in text."""
+    starts = [0]
+    for line in text.splitlines(keepends=True):
+        starts.append(starts[-1] + len(line))
+    last = len(starts) - 1
+    return [(sid, starts[min(lo, last)], starts[min(hi + 1, last)]) for sid, lo, hi in sections]
+
+def assign_sections(metadatas: List[Dict[str, Any]], text: str, sections: List[Tuple[int, int, int]]):
+    """Set "section_id" on chunk metadata: the persisted section the chunk's start offset falls in."""
+    spans = section_spans(text, sections)
+    starts = [lo for _, lo, _ in spans]
+    for md in metadatas:
+        if md.get("start") is None:
+            continue
+        i = bisect.bisect_right(starts, md["start"]) - 1
+        if i >= 0 and md["start"] < spans[i][2]:
+            md["section_id"] = spans[i][0]
+
+def clear_sections(db: Session, document_id: int):
+    """Drop previously stored sections so a document can be re-persisted."""
+    db.query(Section).filter(Section.document_id == document_id).delete(synchronize_session=False)
+
+def _path_in_use(db: Session, doc: Document) -> bool:
+    other_doc = (db.query(Document.id)
+                 .filter(Document.original_path == doc.original_path, Document.id != doc.id).first())
+    pending_job = (db.query(IngestionJob.id)
+                   .filter(IngestionJob.path == doc.original_path, or_(IngestionJob.document_id.is_(None), IngestionJob.document_id != doc.id),
+                           IngestionJob.status.in_(["queued", "running"])).first())
+    return other_doc is not None or pending_job is not None
+
+def delete_document(doc_id: int) -> bool:
+    """
+    Delete a document: its uploaded file, its vectors and its DB rows (sections cascade).
+    Returns False if the document does not exist.
+    """
+    db = SessionLocal()
+    try:
+        doc = db.query(Document).filter(Document.id == doc_id).first()
+        if not doc:
+            return False
+
+        # Remove file from uploads folder, unless another document or a pending ingestion job
+        # still uses it (upload paths are content-addressed, so identical uploads share one)
+        if doc.original_path and os.path.exists(doc.original_path) and not _path_in_use(db, doc):
+            try:
+                os.remove(doc.original_path)
+            except Exception as e:
+                print(f"Warning: could not remove file {doc.original_path}: {e}")
+
+        # Remove embeddings for this document
+        delete_document_vectors(doc_id)
+        summary_store.invalidate(doc_id)
+
+        db.delete(doc)
+        db.commit()
+        return True
+    finally:
+        db.close()
@@ -0,0 +1,157 @@
+# app/services/embedding_cache.py
+import os
+import re
+import hashlib
+import sqlite3
+import threading
+from typing import List, Dict, Any, Callable
+import numpy as np
+from app.config import BASE_DIR
+
+# Persistent cache of chunk embeddings, one directory per model. Vectors live in a
+# memory-mapped float32 matrix (vectors.f32, grown by doubling); a small SQLite table
+# maps sha256(normalized chunk) -> row. The matrix is flushed before its rows are
+# committed, so a crash can only leave unused rows behind, never wrong vectors.
+CACHE_DIR = os.path.join(BASE_DIR, "embedding_cache")
+CACHE_ENABLED = os.environ.get("EMBEDDING_CACHE", "1").lower() in ("1", "true", "yes")
+CACHE_MAX_ROWS = int(os.environ.get("EMBEDDING_CACHE_MAX_ROWS", "500000"))  # ~730MB at 384 dims
+_INITIAL_ROWS = 1024
+
+_WS = re.compile(r"\s+")
+
+_lock = threading.Lock()
+_stores: Dict[str, "_Store"] = {}
+_stats = {"hits": 0, "misses": 0, "full": 0}
+
+
+def normalize_chunk(text: str) -> str:
+    # the tokenizer ignores whitespace layout, so chunks differing only in it share an embedding
+    return _WS.sub(" ", text).strip()
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(normalize_chunk(text).encode("utf-8")).hexdigest()
+
+
+def _model_dir(model_name: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+    return os.path.join(CACHE_DIR, slug)
+
+
+class _Store:
+    """Matrix + hash index for one model. All access goes through the module _lock."""
+
+    def __init__(self, model_name: str):
+        self.dir = _model_dir(model_name)
+        os.makedirs(self.dir, exist_ok=True)
+        self.matrix_path = os.path.join(self.dir, "vectors.f32")
+        self.db = sqlite3.connect(os.path.join(self.dir, "index.sqlite3"), check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS entries (hash TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+        self.db.commit()
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        self.dim = row[0] if row else None
+        self.rows = self.db.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM entries").fetchone()[0]
+        self.matrix = None
+        if self.dim is not None and os.path.exists(self.matrix_path):
+            self._open()
+        elif self.rows:  # index without its matrix: start over
+            self.db.execute("DELETE FROM entries")
+            self.db.commit()
+            self.rows = 0
+
+    def _open(self):
+        capacity = os.path.getsize(self.matrix_path) // (4 * self.dim)
+        self.matrix = np.memmap(self.matrix_path, dtype="float32", mode="r+", shape=(capacity, self.dim))
+
+    def _reserve(self, n: int):
+        capacity = 0 if self.matrix is None else self.matrix.shape[0]
+        if self.rows + n <= capacity:
+            return
+        new_capacity = max(_INITIAL_ROWS, capacity)
+        while new_capacity < self.rows + n:
+            new_capacity *= 2
+        new_capacity = min(new_capacity, CACHE_MAX_ROWS)
+        if self.matrix is not None:
+            self.matrix.flush()
+            self.matrix = None
+        with open(self.matrix_path, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self._open()
+
+    def lookup(self, hashes: List[str]) -> Dict[str, int]:
+        found = {}
+        for i in range(0, len(hashes), 500):  # SQLite bound-parameter limit
+            batch = hashes[i:i + 500]
+            marks = ",".join("?" * len(batch))
+            found.update(self.db.execute(f"SELECT hash, row FROM entries WHERE hash IN ({marks})", batch))
+        return found
+
+    def read(self, rows: List[int]) -> np.ndarray:
+        return np.asarray(self.matrix[rows])
+
+    def store(self, hashes: List[str], vectors: np.ndarray) -> int:
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+            self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dim', ?)", (self.dim,))
+        elif vectors.shape[1] != self.dim:
+            return 0
+        n = min(len(hashes), CACHE_MAX_ROWS - self.rows)
+        if n <= 0:
+            return 0
+        self._reserve(n)
+        start = self.rows
+        self.matrix[start:start + n] = vectors[:n]
+        self.matrix.flush()
+        self.db.executemany("INSERT OR IGNORE INTO entries (hash, row) VALUES (?, ?)",
+                            [(h, start + i) for i, h in enumerate(hashes[:n])])
+        self.db.commit()
+        self.rows = start + n
+        return n
+
+
+def _store(model_name: str) -> _Store:
+    if model_name not in _stores:
+        _stores[model_name] = _Store(model_name)
+    return _stores[model_name]
+
+
+def encode(texts: List[str], model_name: str, encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+    """
+    Embeddings for texts, in order. Only texts missing from the cache (deduplicated)
+    are passed to encode_fn; its output is cached for the next call.
+    """
+    if not CACHE_ENABLED or not texts:
+        return encode_fn(texts)
+    hashes = [chunk_hash(t) for t in texts]
+    with _lock:
+        store = _store(model_name)
+        found = store.lookup(list(set(hashes)))
+        cached = store.read([found[h] for h in found]) if found else None
+    cached_by_hash = {h: cached[i] for i, h in enumerate(found)} if found else {}
+
+    missing: Dict[str, str] = {}
+    for h, t in zip(hashes, texts):
+        if h not in cached_by_hash and h not in missing:
+            missing[h] = t
+    fresh = {}
+    if missing:
+        vectors = np.ascontiguousarray(encode_fn(list(missing.values())), dtype="float32")
+        fresh = dict(zip(missing, vectors))
+        with _lock:
+            stored = store.store(list(missing), vectors)
+            if stored < len(missing):
+                _stats["full"] += len(missing) - stored
+    with _lock:
+        _stats["hits"] += sum(1 for h in hashes if h in cached_by_hash)
+        _stats["misses"] += sum(1 for h in hashes if h not in cached_by_hash)
+    return np.stack([cached_by_hash[h] if h in cached_by_hash else fresh[h] for h in hashes])
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {"enabled": CACHE_ENABLED, "hits": _stats["hits"], "misses": _stats["misses"],
+                "hit_ratio": round(_stats["hits"] / lookups, 4) if lookups else None,
+                "not_stored_full": _stats["full"], "max_rows": CACHE_MAX_ROWS,
+                "entries": {name: s.rows for name, s in _stores.items()}}
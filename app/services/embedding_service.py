@@ -0,0 +1,210 @@
+# app/services/embedding_service.py
+import os
+import time
+import copy
+import queue
+import itertools
+import threading
+from concurrent.futures import Future
+from typing import List, Optional, Dict, Any
+import numpy as np
+
+# One sentence-embedding model for the whole process. Callers enqueue texts; a single
+# worker thread drains the queue, coalescing requests that arrive within
+# EMB_BATCH_WAIT_MS (up to EMB_BATCH_MAX texts) into one encode call, so concurrent
+# queries share a forward pass instead of each running a batch of one. Requests larger
+# than EMB_BATCH_MAX are split into slices, and a query's slice overtakes the remaining
+# slices of an earlier bulk request (e.g. a whole document during ingestion).
+EMB_MODEL = os.environ.get("EMB_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# torch: SentenceTransformer in PyTorch; onnx: exported, int8-quantized model on ONNX Runtime
+EMB_BACKEND = os.environ.get("EMB_BACKEND", "torch").lower()
+EMB_BATCH_MAX = int(os.environ.get("EMB_BATCH_MAX", "64"))
+EMB_BATCH_WAIT_MS = float(os.environ.get("EMB_BATCH_WAIT_MS", "5"))
+EMB_ENCODE_TIMEOUT = float(os.environ.get("EMB_ENCODE_TIMEOUT", "600"))  # seconds; covers a first model load
+
+_model = None
+_backend = None  # backend actually loaded (onnx falls back to torch if unavailable)
+_model_lock = threading.Lock()
+_tokenizer = None
+_queue: "queue.PriorityQueue" = queue.PriorityQueue()  # (slice no, seq, (texts, request, slice no))
+_seq = itertools.count()
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+_stats = {"requests": 0, "texts": 0, "batches": 0}
+
+
+def get_model():
+    global _model, _backend
+    with _model_lock:
+        if _model is None:
+            if EMB_BACKEND == "onnx":
+                try:
+                    from app.services import onnx_embedder
+                    _model, _backend = onnx_embedder.load(EMB_MODEL), "onnx"
+                except ImportError as e:
+                    print(f"[WARN] ONNX backend unavailable ({e}); using PyTorch.")
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                _model, _backend = SentenceTransformer(EMB_MODEL), "torch"
+        return _model
+
+
+def get_tokenizer():
+    """
+    A private copy of the model's tokenizer for chunking. The worker thread encodes with
+    padding/truncation through model.tokenizer, and HF fast tokenizers raise "Already
+    borrowed" when another thread uses the same instance with different settings.
+    """
+    global _tokenizer
+    model = get_model()
+    with _model_lock:
+        if _tokenizer is None:
+            tokenizer = copy.deepcopy(model.tokenizer)
+            tokenizer("")  # settle its truncation/padding state once, before it is shared
+            _tokenizer = tokenizer
+        return _tokenizer
+
+
+def model_key() -> str:
+    """Identifies the vectors the loaded model produces (cache key)."""
+    get_model()
+    if _backend == "onnx":
+        from app.services.onnx_embedder import ONNX_QUANTIZE
+        return f"{EMB_MODEL}@onnx{'-int8' if ONNX_QUANTIZE else ''}"
+    return EMB_MODEL
+
+
+class _Request:
+    """One submit() call; large requests are split into EMB_BATCH_MAX-text slices."""
+
+    def __init__(self, n_slices: int):
+        self.future: Future = Future()
+        self.parts: List[Optional[np.ndarray]] = [None] * n_slices
+        self.remaining = n_slices
+        self.lock = threading.Lock()
+
+    def done(self, i: int, emb: np.ndarray):
+        with self.lock:
+            if self.future.done():
+                return
+            self.parts[i] = emb
+            self.remaining -= 1
+            if self.remaining == 0:
+                self.future.set_result(self.parts[0] if len(self.parts) == 1 else np.vstack(self.parts))
+
+    def fail(self, e: BaseException):
+        with self.lock:
+            if not self.future.done():
+                self.future.set_exception(e)
+
+
+def _put(slice_no: int, item):
+    # slice number first: a query's only slice goes ahead of slice 1..n of an earlier bulk
+    # request, so queries are not stuck behind a whole document's chunks
+    _queue.put((slice_no, next(_seq), item))
+
+
+def _collect(first):
+    """The first slice plus whatever else arrives before the window closes."""
+    batch, n = [first], len(first[0])
+    deadline = time.monotonic() + EMB_BATCH_WAIT_MS / 1000.0
+    while n < EMB_BATCH_MAX:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            _, _, item = _queue.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if item is None:
+            _put(-1, None)  # let the main loop see the stop signal
+            break
+        batch.append(item)
+        n += len(item[0])
+    return batch
+
+
+def _fail_pending(e: BaseException):
+    while True:
+        try:
+            _, _, item = _queue.get_nowait()
+        except queue.Empty:
+            return
+        if item is not None:
+            item[1].fail(e)
+
+
+def _run():
+    while True:
+        _, _, first = _queue.get()
+        if first is None:
+            _fail_pending(RuntimeError("embedding service shut down"))
+            return
+        batch = _collect(first)
+        texts = [t for item in batch for t in item[0]]
+        try:
+            # loaded here, not before the loop: a model that fails to load fails the
+            # waiting requests instead of killing the worker and leaving them hanging
+            model = get_model()
+            emb = model.encode(texts, batch_size=EMB_BATCH_MAX, convert_to_numpy=True,
+                               normalize_embeddings=True)
+        except Exception as e:
+            for _, req, _ in batch:
+                req.fail(e)
+            continue
+        _stats["batches"] += 1
+        pos = 0
+        for item_texts, req, i in batch:
+            req.done(i, emb[pos:pos + len(item_texts)])
+            pos += len(item_texts)
+
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="embedding-service", daemon=True)
+            _worker.start()
+
+
+def submit(texts: List[str]) -> Future:
+    """Queue texts for encoding; the future resolves to their normalized embeddings."""
+    texts = list(texts)
+    if not texts:
+        fut: Future = Future()
+        fut.set_result(np.zeros((0, embedding_dim()), dtype="float32"))
+        return fut
+    slices = [texts[i:i + EMB_BATCH_MAX] for i in range(0, len(texts), EMB_BATCH_MAX)]
+    req = _Request(len(slices))
+    _ensure_worker()
+    _stats["requests"] += 1
+    _stats["texts"] += len(texts)
+    for i, part in enumerate(slices):
+        _put(i, (part, req, i))
+    return req.future
+
+
+def encode(texts: List[str], timeout: Optional[float] = EMB_ENCODE_TIMEOUT) -> np.ndarray:
+    """Blocking encode; raises concurrent.futures.TimeoutError after timeout seconds."""
+    return submit(texts).result(timeout=timeout)
+
+
+def embedding_dim() -> int:
+    return get_model().get_sentence_embedding_dimension()
+
+
+def stats() -> Dict[str, Any]:
+    batches = _stats["batches"]
+    return {"model": EMB_MODEL, "backend": _backend, "requests": _stats["requests"], "texts": _stats["texts"],
+            "batches": batches, "queued": _queue.qsize(),
+            "mean_requests_per_batch": round(_stats["requests"] / batches, 2) if batches else None,
+            "batch_max": EMB_BATCH_MAX, "batch_wait_ms": EMB_BATCH_WAIT_MS}
+
+
+def shutdown():
+    global _worker
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            _put(-1, None)
+            _worker.join(timeout=10)
+        _worker = None
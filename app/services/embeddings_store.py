@@ -3,119 +3,570 @@ import os
 import faiss
 import numpy as np
 import pickle
-from typing import List, Dict, Any, Optional
-from sentence_transformers import SentenceTransformer
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 from app.config import BASE_DIR
+from app.services import ann_index
+from app.services import chunk_store
+from app.services import embedding_cache
+from app.services import embedding_service
+from app.services.embedding_service import embedding_dim
+from app.utils.lru import LRUCache
 import sqlite3
+import copy
 import json
+import struct
+import threading
+import zlib
 
-EMB_MODEL = os.environ.get("EMB_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 INDEX_DIR = os.path.join(BASE_DIR, "vectorstore")
 os.makedirs(INDEX_DIR, exist_ok=True)
 INDEX_PATH = os.path.join(INDEX_DIR, "faiss.index")
-META_PATH = os.path.join(INDEX_DIR, "meta.pkl")  # map id -> metadata
+META_PATH = os.path.join(INDEX_DIR, "meta.pkl")  # legacy id -> metadata pickle, migrated to SQLite
 DIM_PATH = os.path.join(INDEX_DIR, "dim.json")
+STATE_PATH = os.path.join(INDEX_DIR, "state.json")  # id allocator, written with each checkpoint
+
+# Adds are appended to a write-ahead log (one segment file per checkpoint period);
+# a background thread periodically snapshots the index + id state with atomic renames
+# and drops the segments the snapshot covers. Startup replays whatever is left.
+WAL_DIR = os.path.join(INDEX_DIR, "wal")
+os.makedirs(WAL_DIR, exist_ok=True)
+CHECKPOINT_INTERVAL = float(os.environ.get("INDEX_CHECKPOINT_SECONDS", "60"))
+CHECKPOINT_WAL_BYTES = int(os.environ.get("INDEX_CHECKPOINT_WAL_MB", "64")) * 1024 * 1024
+WAL_FSYNC = os.environ.get("INDEX_WAL_FSYNC", "1").lower() in ("1", "true", "yes")
+# filtered searches over at most this many vectors are scored exactly instead of via the index
+FILTER_EXACT_MAX = int(os.environ.get("SEARCH_FILTER_EXACT_MAX", "4096"))
+# repeated questions skip the encoder (query LRU) and the index scan (result cache);
+# results are keyed by _index_version, so any add/delete/clear makes old entries unreachable
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_EMB_CACHE_SIZE", "1024"))
+RESULT_CACHE_SIZE = int(os.environ.get("SEARCH_RESULT_CACHE_SIZE", "512"))
+
+_REC_HEADER = struct.Struct("<4sBIQII")  # magic, op, n, start_id, dim, meta_len
+_REC_MAGIC = b"WAL1"
+_OP_ADD = 1
+_OP_DELETE = 2
+
 # lazy load
-_model = None
 _index = None
-_metadata = None
+# vectors carry stable 64-bit ids; their metadata is in the SQLite `chunks` table (chunk_store)
+_next_id = 0
+_tombstones = set()  # deleted ids in indexes without remove_ids (HNSW); filtered at search time
+_migrating = False
+_generation = 0      # bumped by clear_store so an in-flight migration is discarded
+_index_version = 0   # bumped on every change to the searchable contents
+_query_cache = LRUCache(QUERY_CACHE_SIZE)
+_result_cache = LRUCache(RESULT_CACHE_SIZE)
+# guards _index/WAL; ingestion workers and request threads share the store
+_lock = threading.RLock()
+# serializes checkpoints against each other and against clear_store; taken before _lock
+_ckpt_lock = threading.Lock()
+_ckpt_wakeup = threading.Event()
+_ckpt_thread = None
+_stopping = False
+_wal_file = None
+_wal_seq = 0
+_wal_bytes = 0
+_dirty = False  # WAL holds records not yet in a checkpoint
+
+def _new_index(dim: int):
+    return ann_index.build_index("flat", dim)
+
+def _as_id_map(index):
+    """Wrap a legacy positional index, keeping each vector's position as its id."""
+    if isinstance(index, (faiss.IndexIDMap2, faiss.IndexIVF)):
+        return index
+    wrapped = _new_index(index.d)
+    if index.ntotal:
+        wrapped.add_with_ids(index.reconstruct_n(0, index.ntotal), np.arange(index.ntotal, dtype="int64"))
+    return wrapped
+
+def _remove_ids(ids: List[int]):
+    if ann_index.supports_remove(_index):
+        _index.remove_ids(np.array(ids, dtype="int64"))
+    else:
+        _tombstones.update(ids)
+
+def _exclusion_selector():
+    if not _tombstones:
+        return None
+    return faiss.IDSelectorNot(faiss.IDSelectorBatch(np.array(sorted(_tombstones), dtype="int64")))
+
+
+# ---- write-ahead log ----------------------------------------------------
+
+def _segment_path(seq: int) -> str:
+    return os.path.join(WAL_DIR, f"{seq:08d}.log")
+
+def _segments() -> List[Tuple[int, str]]:
+    out = []
+    for name in os.listdir(WAL_DIR):
+        if name.endswith(".log") and name[:-4].isdigit():
+            out.append((int(name[:-4]), os.path.join(WAL_DIR, name)))
+    return sorted(out)
+
+def _encode_record(op: int, start_id: int, vectors: Optional[np.ndarray], metas) -> bytes:
+    vec = np.ascontiguousarray(vectors if vectors is not None else np.zeros((0, 0)), dtype="float32")
+    meta = json.dumps(metas).encode("utf-8")
+    n, dim = vec.shape
+    body = _REC_HEADER.pack(_REC_MAGIC, op, n, start_id, dim, len(meta)) + vec.tobytes() + meta
+    return body + struct.pack("<I", zlib.crc32(body))
+
+def _read_records(path: str, repair: bool = True) -> Iterator[Tuple[int, int, np.ndarray, List[Dict[str, Any]]]]:
+    """
+    Yield (op, start_id, vectors, metas) from a segment, truncating a torn tail. With
+    repair=False the file is only read (another process may still be appending to it).
+    """
+    with open(path, "r+b" if repair else "rb") as f:
+        good = 0
+        while True:
+            head = f.read(_REC_HEADER.size)
+            if not head:
+                break
+            if len(head) < _REC_HEADER.size:
+                break
+            magic, op, n, start_id, dim, meta_len = _REC_HEADER.unpack(head)
+            if magic != _REC_MAGIC:
+                break
+            vec_bytes = f.read(n * dim * 4)
+            meta_bytes = f.read(meta_len)
+            crc = f.read(4)
+            if len(vec_bytes) < n * dim * 4 or len(meta_bytes) < meta_len or len(crc) < 4:
+                break
+            if struct.unpack("<I", crc)[0] != zlib.crc32(head + vec_bytes + meta_bytes):
+                break
+            good = f.tell()
+            vectors = np.frombuffer(vec_bytes, dtype="float32").reshape(n, dim)
+            yield op, start_id, vectors, json.loads(meta_bytes.decode("utf-8"))
+        if repair and good < os.fstat(f.fileno()).st_size:
+            print(f"[WARN] Truncating torn WAL tail in {path} at byte {good}")
+            f.truncate(good)
+
+def _open_wal():
+    global _wal_file, _wal_seq, _wal_bytes
+    segs = _segments()
+    _wal_seq = (segs[-1][0] + 1) if segs else 1
+    _wal_file = open(_segment_path(_wal_seq), "ab")
+    _wal_bytes = 0
+
+def _close_wal():
+    global _wal_file
+    if _wal_file is not None:
+        _wal_file.close()
+        _wal_file = None
+
+def _append_wal(op: int, start_id: int, vectors: Optional[np.ndarray], metas):
+    global _wal_bytes, _dirty
+    rec = _encode_record(op, start_id, vectors, metas)
+    _wal_file.write(rec)
+    _wal_file.flush()
+    if WAL_FSYNC:
+        os.fsync(_wal_file.fileno())
+    _wal_bytes += len(rec)
+    _dirty = True
+    if _wal_bytes >= CHECKPOINT_WAL_BYTES:
+        _ckpt_wakeup.set()
+
+def _replay_wal():
+    """Apply logged adds/deletes on top of the checkpoint. Callers hold _lock."""
+    global _dirty, _next_id
+    present = set(ann_index.stored_ids(_index).tolist())
+    replayed = 0
+    for _, path in _segments():
+        _dirty = True  # fold leftover segments into the next checkpoint
+        for op, start_id, vectors, metas in _read_records(path):
+            if op == _OP_ADD and vectors.shape[1] == _index.d:
+                ids = np.arange(start_id, start_id + len(vectors), dtype="int64")
+                # the checkpoint may already hold the vectors but not their metadata (or vice versa)
+                missing = np.array([vid not in present for vid in ids.tolist()])
+                if missing.any():
+                    _index.add_with_ids(vectors[missing], ids[missing])
+                    present.update(ids[missing].tolist())
+                    replayed += int(missing.sum())
+                chunk_store.insert_chunks(ids.tolist(), metas)
+                _next_id = max(_next_id, start_id + len(vectors))
+            elif op == _OP_DELETE:
+                ids = [vid for vid in metas["ids"] if vid in present]
+                if ids:
+                    _remove_ids(ids)
+                    present.difference_update(ids)
+                chunk_store.delete_chunks(metas["ids"])
+    if replayed:
+        print(f"[INFO] Replayed {replayed} vectors from the write-ahead log.")
 
-def get_model():
-    global _model
-    if _model is None:
-        _model = SentenceTransformer(EMB_MODEL)
-    return _model
 
+# ---- checkpointing ------------------------------------------------------
+
+def _atomic_write(path: str, data) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def checkpoint(force: bool = False):
+    """Snapshot the index atomically and drop the WAL segments it covers."""
+    global _dirty
+    with _ckpt_lock:
+        with _lock:
+            if _index is None or not (_dirty or force):
+                return
+            # rotate: later adds go to a fresh segment while the snapshot is written
+            _close_wal()
+            done_seq = _wal_seq
+            index_bytes = faiss.serialize_index(_index)
+            state_bytes = json.dumps({"next_id": _next_id,
+                                      "tombstones": sorted(_tombstones)}).encode("utf-8")
+            _open_wal()
+            _dirty = False
+        _atomic_write(INDEX_PATH, memoryview(index_bytes))
+        _atomic_write(STATE_PATH, state_bytes)
+        for seq, path in _segments():
+            if seq <= done_seq:
+                os.remove(path)
 
 def save_index():
-    global _index, _metadata
-    if _index is not None:
-        faiss.write_index(_index, INDEX_PATH)
-    with open(META_PATH, "wb") as f:
-        pickle.dump(_metadata, f)
+    """Persist the current state immediately (full snapshot)."""
+    checkpoint(force=True)
+
+def _checkpoint_loop():
+    while not _stopping:
+        _ckpt_wakeup.wait(CHECKPOINT_INTERVAL)
+        _ckpt_wakeup.clear()
+        if _stopping:
+            break
+        try:
+            checkpoint()
+        except Exception as e:
+            print(f"[WARN] FAISS checkpoint failed: {e}")
+
+def _start_checkpointer():
+    global _ckpt_thread
+    if _ckpt_thread is None:
+        _ckpt_thread = threading.Thread(target=_checkpoint_loop, name="faiss-checkpoint", daemon=True)
+        _ckpt_thread.start()
+
+def recover():
+    """Load the last checkpoint and replay the log eagerly (e.g. at app startup)."""
+    if _stored_dim() is not None or os.path.exists(INDEX_PATH) or _segments():
+        # at the model's dimension, so a store written by a different model is reset here
+        with _lock:
+            _init_index(embedding_dim())
+
+def shutdown():
+    """Stop the checkpointer and write a final snapshot."""
+    global _stopping
+    _stopping = True
+    _ckpt_wakeup.set()
+    checkpoint()
+    with _lock:
+        _close_wal()
+
 
-def add_texts(texts: List[str], metadatas: List[Dict[str, Any]]):
+# ---- ANN promotion ------------------------------------------------------
+
+def _start_migration(kind: str):
+    global _migrating
+    with _lock:
+        if _migrating:
+            return
+        _migrating = True
+    threading.Thread(target=_migrate, args=(kind,), name="faiss-migrate", daemon=True).start()
+
+def _migrate(kind: str):
+    """
+    Online flat -> ANN migration: train and fill the new index from a snapshot
+    without holding the lock, then catch up on adds/deletes made meanwhile and swap.
+    """
+    global _index, _dirty, _migrating, _index_version
+    try:
+        with _lock:
+            if _index is None:
+                return
+            generation = _generation
+            ids = ann_index.stored_ids(_index)
+            vectors = _index.index.reconstruct_n(0, _index.ntotal)  # flat storage is in id_map order
+            dim = _index.d
+        print(f"[INFO] Promoting FAISS index to {kind} ({len(ids)} vectors)...")
+        new_index = ann_index.build_index(kind, dim, len(ids))
+        new_index.train(ann_index.train_sample(vectors))
+        new_index.add_with_ids(vectors, ids)
+        del vectors
+
+        with _lock:
+            if _index is None or generation != _generation:
+                return  # store was cleared meanwhile
+            current = ann_index.stored_ids(_index)
+            snap = set(ids.tolist())
+            added = np.array([vid for vid in current.tolist() if vid not in snap], dtype="int64")
+            removed = snap.difference(current.tolist()) | (_tombstones & snap)
+            if len(added):
+                new_index.add_with_ids(np.vstack([_index.reconstruct(int(v)) for v in added]), added)
+            old_index = _index
+            _index = new_index
+            _index_version += 1  # ANN results can differ from the flat ones
+            _tombstones.clear()
+            if removed:
+                _remove_ids(sorted(removed))
+            del old_index
+            _dirty = True
+        checkpoint()
+        print(f"[INFO] FAISS index promoted to {kind}.")
+    except Exception as e:
+        print(f"[WARN] FAISS index promotion failed: {e}")
+    finally:
+        _migrating = False
+
+def index_info() -> Dict[str, Any]:
+    with _lock:
+        if _index is None:
+            return {"type": None, "ntotal": 0}
+        return {"type": ann_index.index_kind(_index), "ntotal": int(_index.ntotal),
+                "tombstones": len(_tombstones), "migrating": _migrating,
+                "target_type": ann_index.INDEX_TYPE, "promote_threshold": ann_index.ANN_PROMOTE_THRESHOLD}
+
+
+# ---- public API ---------------------------------------------------------
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """Encode texts into normalized embeddings (no index access). Cached chunks skip the model."""
+    return embedding_cache.encode(texts, embedding_service.model_key(), embedding_service.encode)
+
+def _bump_version():
+    global _index_version
+    _index_version += 1
+
+def add_texts(texts: List[str], metadatas: List[Dict[str, Any]], embeddings: Optional[np.ndarray] = None):
     """
     texts: list of strings
     metadatas: list of dicts (same length) e.g. {"doc_id":123, "section_id":45, "text": "..."}
+    embeddings: optional precomputed output of embed_texts(texts)
+    Returns the stable vector ids assigned to the batch.
+    Cost is O(batch): the batch is appended to the WAL, not rewritten into the snapshot.
+    """
+    global _next_id
+    if not texts:
+        return []
+    emb = np.ascontiguousarray(embed_texts(texts) if embeddings is None else embeddings, dtype="float32")
+    if len(metadatas) != len(texts) or emb.ndim != 2 or emb.shape[0] != len(texts):
+        raise ValueError(f"{len(texts)} texts, {len(metadatas)} metadatas and {emb.shape} embeddings do not match")
+    with _lock:
+        _init_index(embedding_dim())
+        if emb.shape[1] != _index.d:
+            raise ValueError(f"Embedding dim {emb.shape[1]} != index dim {_index.d}")
+
+        start_id = _next_id
+        ids = list(range(start_id, start_id + len(texts)))
+        _append_wal(_OP_ADD, start_id, emb, metadatas)  # durable before it becomes visible
+        _index.add_with_ids(emb, np.array(ids, dtype="int64"))
+        _next_id = start_id + len(texts)
+        chunk_store.insert_chunks(ids, metadatas)
+        _bump_version()
+        promote = ann_index.should_promote(_index) and not _migrating
+    if promote:
+        _start_migration(ann_index.INDEX_TYPE)
+    return ids
+
+def delete_document_vectors(doc_id) -> int:
+    """Remove every vector of a document with one remove_ids call. Returns how many were removed."""
+    with _lock:
+        _init_index(embedding_dim())
+        ids = chunk_store.vector_ids_for_doc(doc_id)
+        if not ids:
+            return 0
+        _append_wal(_OP_DELETE, 0, None, {"ids": ids})
+        _remove_ids(ids)
+        chunk_store.delete_chunks(ids)
+        _bump_version()
+    return len(ids)
+
+def _search_exact(q_emb: np.ndarray, ids: List[int], top_k: int):
+    """Brute-force scores over a small candidate set (flat/HNSW stores keep the vectors)."""
+    ids = np.array(ids, dtype="int64")
+    vectors = _index.reconstruct_batch(ids)
+    sims = q_emb @ vectors.T
+    k = min(top_k, len(ids))
+    top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    top = np.take_along_axis(top, np.argsort(-np.take_along_axis(sims, top, axis=1), axis=1), axis=1)
+    return np.take_along_axis(sims, top, axis=1), ids[top]
+
+def embed_queries(queries: List[str]) -> np.ndarray:
+    """(n, dim) normalized query embeddings; LRU misses are encoded in one batch."""
+    model = embedding_service.model_key()
+    out: List[Optional[np.ndarray]] = [None] * len(queries)
+    missing: Dict[str, List[int]] = {}
+    for i, q in enumerate(queries):
+        cached = _query_cache.get((model, q))
+        if cached is None:
+            missing.setdefault(q, []).append(i)
+        else:
+            out[i] = cached[0]
+    if missing:
+        emb = embedding_service.encode(list(missing))  # batched with concurrent queries
+        for q, e in zip(missing, emb):
+            _query_cache.put((model, q), e[None, :])
+            for i in missing[q]:
+                out[i] = e
+    return np.ascontiguousarray(np.stack(out), dtype="float32")
+
+def embed_query(query: str) -> np.ndarray:
+    """(1, dim) normalized query embedding, served from the query LRU when possible."""
+    return embed_queries([query])
+
+def _scope_key(doc_ids: Optional[List[int]], source: Optional[str]):
+    return (tuple(sorted(doc_ids)) if doc_ids is not None else None, source)
+
+def search(query: str, top_k: int = 5, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+           doc_ids: Optional[List[int]] = None, source: Optional[str] = None):
     """
-    model = get_model()
-    emb = model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
-    dim = emb.shape[1]
-    _init_index(dim)
-
-    # ensure index is of correct dim — if not, recreate (simple approach)
-    if _index.ntotal == 0:
-        # If IndexFlatIP, nothing to check
-        pass
-
-    start_id = _index.ntotal
-    _index.add(emb)  # adds vectors
-    # assign metadata ids: use integer ids starting from 0 to ntotal-1
-    for i, md in enumerate(metadatas):
-        _metadata[start_id + i] = md
-    save_index()
-    return list(range(start_id, start_id + len(texts)))
-
-def search(query: str, top_k: int = 5):
+    Returns list of (score, metadata) for top_k.
+    nprobe (IVF) / ef_search (HNSW) trade recall for latency per query.
+    doc_ids / source restrict the search to matching chunks; the filter is applied
+    inside the index search (ID selector), or exactly when few vectors match.
     """
-    Returns list of (score, metadata) for top_k
+    return search_batch([query], top_k, nprobe, ef_search, [(doc_ids, source)])[0]
+
+def search_batch(queries: List[str], top_k: int = 5, nprobe: Optional[int] = None,
+                 ef_search: Optional[int] = None,
+                 filters: Optional[List[Tuple[Optional[List[int]], Optional[str]]]] = None):
     """
-    model = get_model()
-    q_emb = model.encode([query], convert_to_numpy=True, normalize_embeddings=True)
-    _init_index(q_emb.shape[1])
-    if _index.ntotal == 0:
-        return []
-    scores, idxs = _index.search(q_emb, top_k)
-    results = []
-    for sc, idx in zip(scores[0], idxs[0]):
-        if idx < 0:
-            continue
-        md = _metadata.get(int(idx), {})
-        results.append({"score": float(sc), "metadata": md})
+    search() for many queries at once: one encode call for the uncached queries and one
+    index search per distinct (doc_ids, source) filter over that group's query matrix.
+    """
+    filters = filters or [(None, None)] * len(queries)
+    version = _index_version
+    scopes = [_scope_key(d, s) for d, s in filters]
+    keys = [(q, top_k, nprobe, ef_search) + scope + (version,) for q, scope in zip(queries, scopes)]
+    results: List[Optional[List[Dict[str, Any]]]] = [None] * len(queries)
+    todo = []
+    for i, key in enumerate(keys):
+        cached = _result_cache.get(key)
+        if cached is not None:
+            results[i] = copy.deepcopy(cached)
+        else:
+            todo.append(i)
+    if not todo:
+        return results
+
+    q_emb = embed_queries([queries[i] for i in todo])
+    groups: Dict[Any, List[int]] = {}
+    for row, i in enumerate(todo):
+        groups.setdefault(scopes[i], []).append(row)
+    allowed = {scope: chunk_store.vector_ids_matching(list(scope[0]) if scope[0] is not None else None,
+                                                      scope[1])
+               for scope in groups if scope != (None, None)}
+
+    rows: Dict[int, List[Tuple[float, int]]] = {row: [] for row in range(len(todo))}
+    with _lock:
+        _init_index(q_emb.shape[1])
+        for scope, group in groups.items():
+            if _index.ntotal == 0:
+                break
+            filtered = scope != (None, None)
+            ids = allowed.get(scope)
+            if filtered and not ids:
+                continue
+            q = q_emb[group]
+            if filtered and len(ids) <= FILTER_EXACT_MAX and ann_index.supports_reconstruct(_index):
+                scores, idxs = _search_exact(q, ids, top_k)
+            else:
+                # deleted vectors have no chunk rows, so `ids` already excludes tombstones
+                sel = faiss.IDSelectorBatch(np.array(ids, dtype="int64")) if filtered \
+                    else _exclusion_selector()
+                params = ann_index.search_params(_index, nprobe, ef_search, sel, all_lists=filtered)
+                scores, idxs = _index.search(q, top_k, params=params)
+            for row, sc_row, id_row in zip(group, scores, idxs):
+                rows[row] = [(float(sc), int(idx)) for sc, idx in zip(sc_row, id_row) if idx >= 0]
+
+    # only the top-k metadata rows are read from SQLite, in one query for the whole batch
+    metas = chunk_store.fetch(sorted({idx for hits in rows.values() for _, idx in hits}))
+    for row, i in enumerate(todo):
+        results[i] = [{"score": sc, "metadata": copy.deepcopy(metas.get(idx, {}))} for sc, idx in rows[row]]
+        if _index_version == version:  # nothing changed while we searched
+            _result_cache.put(keys[i], copy.deepcopy(results[i]))
     return results
 
+def index_version() -> int:
+    return _index_version
+
+def cache_stats() -> Dict[str, Any]:
+    return {"query_embedding": _query_cache.stats(), "search_results": _result_cache.stats(),
+            "index_version": _index_version}
+
+def _remove_persisted():
+    for path in (INDEX_PATH, META_PATH, STATE_PATH):
+        if os.path.exists(path):
+            os.remove(path)
+    for _, path in _segments():
+        os.remove(path)
+
 def clear_store():
-    global _index, _metadata
-    if os.path.exists(INDEX_PATH):
-        os.remove(INDEX_PATH)
-    if os.path.exists(META_PATH):
-        os.remove(META_PATH)
-    _index = None
-    _metadata = None
+    global _index, _dirty, _next_id, _generation
+    with _ckpt_lock:
+        with _lock:
+            _close_wal()
+            _remove_persisted()
+            chunk_store.clear_chunks()
+            _index = None
+            _generation += 1
+            _bump_version()
+            _tombstones.clear()
+            _next_id = 0
+            _dirty = False
 
-def _init_index(dim: int):
-    global _index, _metadata
-    stored_dim = None
+def _stored_dim() -> Optional[int]:
     if os.path.exists(DIM_PATH):
         try:
-            import json
             with open(DIM_PATH, "r") as f:
-                stored_dim = json.load(f).get("dim")
-        except:
+                return json.load(f).get("dim")
+        except Exception:
             pass
+    return None
 
-    if _index is None:
-        if os.path.exists(INDEX_PATH):
-            if stored_dim is not None and stored_dim != dim:
-                # dimension mismatch → reset
-                print(f"[WARN] FAISS index dim {stored_dim} != model dim {dim}. Recreating index.")
-                os.remove(INDEX_PATH)
-                os.remove(META_PATH) if os.path.exists(META_PATH) else None
-                _index = faiss.IndexFlatIP(dim)
-                _metadata = {}
-            else:
-                _index = faiss.read_index(INDEX_PATH)
-        else:
-            _index = faiss.IndexFlatIP(dim)
+def _init_index(dim: int):
+    """Load checkpoint + replay WAL on first use. Callers hold _lock."""
+    global _index, _next_id, _dirty
+    if _index is not None:
+        if _index.d != dim:
+            raise ValueError(f"Vectors of dim {dim} do not match the loaded index (dim {_index.d})")
+        return
+    loaded = faiss.read_index(INDEX_PATH) if os.path.exists(INDEX_PATH) else None
+    stored_dim = loaded.d if loaded is not None else _stored_dim()
+    compatible = stored_dim is None or stored_dim == dim
+    if not compatible:
+        # dimension mismatch (the embedding model changed) → reset
+        print(f"[WARN] FAISS index dim {stored_dim} != model dim {dim}. Recreating index.")
+        _remove_persisted()
+        chunk_store.clear_chunks()
+        loaded = None
 
-        if os.path.exists(META_PATH):
+    if loaded is not None:
+        _index = _as_id_map(loaded)
+        _dirty = _index is not loaded  # persist the migrated index at the next checkpoint
+    else:
+        _index = _new_index(dim)
+
+    if os.path.exists(META_PATH):
+        if compatible:
             with open(META_PATH, "rb") as f:
-                _metadata = pickle.load(f)
-        else:
-            _metadata = {}
+                chunk_store.import_legacy(pickle.load(f))
+            print("[INFO] Migrated meta.pkl into the chunks table.")
+        os.remove(META_PATH)
+
+    _next_id = chunk_store.max_vector_id() + 1
+    _tombstones.clear()
+    if os.path.exists(STATE_PATH) and compatible:
+        with open(STATE_PATH, "r") as f:
+            state = json.load(f)
+        _next_id = max(_next_id, state.get("next_id", 0))
+        _tombstones.update(state.get("tombstones", []))
+
+    _replay_wal()
+    _open_wal()
+    _start_checkpointer()
+    if ann_index.should_promote(_index):
+        _start_migration(ann_index.INDEX_TYPE)
 
     # store current dim
-    with open(DIM_PATH, "w") as f:
-        import json
-        json.dump({"dim": dim}, f)
\ No newline at end of file
+    if _stored_dim() != dim:
+        with open(DIM_PATH, "w") as f:
+            json.dump({"dim": dim}, f)
@@ -0,0 +1,140 @@
+# app/services/extraction_cache.py
+import os
+import json
+import hashlib
+import threading
+from typing import Optional, Dict, Any, Iterator
+from app.config import BASE_DIR
+from app.services.extractor import extract_document, iter_pages, join_pages, PageText, EXTRACTOR_VERSION
+from app.services.cleaner import clean_text
+from app.services import ocr_pool
+from app.utils.file_handler import file_sha256
+
+# Content-addressed cache of extract_document() results, one JSON file per entry.
+# Recency is tracked through file mtimes so LRU order survives restarts.
+CACHE_DIR = os.path.join(BASE_DIR, "extraction_cache")
+os.makedirs(CACHE_DIR, exist_ok=True)
+CACHE_MAX_BYTES = int(os.environ.get("EXTRACTION_CACHE_MB", "512")) * 1024 * 1024
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+_total_bytes = None  # lazily computed from disk
+
+def cache_key(digest: str, enable_ocr: bool) -> str:
+    raw = f"{digest}:{EXTRACTOR_VERSION}:{int(bool(enable_ocr))}"
+    if enable_ocr:  # render settings change OCR output
+        raw += f":{ocr_pool.OCR_DPI}:{int(ocr_pool.OCR_GRAYSCALE)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _entry_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+def _entries():
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith(".json"):
+            path = os.path.join(CACHE_DIR, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            yield path, st.st_size, st.st_mtime
+
+def _ensure_total():
+    global _total_bytes
+    if _total_bytes is None:
+        _total_bytes = sum(size for _, size, _ in _entries())
+
+def get(digest: str, enable_ocr: bool = True) -> Optional[Dict[str, Any]]:
+    path = _entry_path(cache_key(digest, enable_ocr))
+    with _lock:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            _stats["misses"] += 1
+            return None
+        os.utime(path)  # mark as most recently used
+        _stats["hits"] += 1
+    return entry
+
+def put(digest: str, enable_ocr: bool, result: Dict[str, Any]):
+    global _total_bytes
+    path = _entry_path(cache_key(digest, enable_ocr))
+    data = json.dumps({"text": result["text"], "pages": result["pages"]}).encode("utf-8")
+    with _lock:
+        _ensure_total()
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        _total_bytes += len(data) - old_size
+        _evict()
+
+def _evict():
+    """Drop least recently used entries until the cache fits CACHE_MAX_BYTES. Caller holds _lock."""
+    global _total_bytes
+    if _total_bytes <= CACHE_MAX_BYTES:
+        return
+    for path, size, _ in sorted(_entries(), key=lambda e: e[2]):
+        if _total_bytes <= CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        _total_bytes -= size
+        _stats["evictions"] += 1
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        _ensure_total()
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "hit_ratio": _stats["hits"] / lookups if lookups else 0.0,
+            "bytes": _total_bytes,
+            "max_bytes": CACHE_MAX_BYTES,
+        }
+
+def extract_cached(path: str, ext: str, digest: Optional[str] = None,
+                   enable_ocr: bool = True) -> Dict[str, Any]:
+    """
+    extract_document() behind the cache. digest is the file's SHA-256
+    (as returned by save_upload); it is computed from disk when omitted.
+    """
+    digest = digest or file_sha256(path)
+    cached = get(digest, enable_ocr)
+    if cached is not None:
+        return cached
+    result = extract_document(path, ext, enable_ocr)
+    if not result["failed_pages"]:  # an incomplete extraction must not be served again
+        put(digest, enable_ocr, result)
+    return result
+
+def extract_and_clean_cached(path: str, ext: str, digest: Optional[str] = None,
+                             enable_ocr: bool = True) -> str:
+    return extract_cached(path, ext, digest, enable_ocr)["text"]
+
+def iter_pages_cached(path: str, ext: str, digest: Optional[str] = None,
+                      enable_ocr: bool = True) -> Iterator[PageText]:
+    """
+    Cleaned pages one at a time. A hit replays the stored pages; a miss streams
+    from the extractor and stores the entry once the last page is produced, unless
+    a page failed (check PageText.failed).
+    """
+    digest = digest or file_sha256(path)
+    cached = get(digest, enable_ocr)
+    if cached is not None:
+        for i, text in enumerate(cached["pages"]):
+            yield PageText(page_no=i + 1, text=text)
+        return
+    pages, failed = [], []
+    for page in iter_pages(path, ext, enable_ocr):
+        page.text = clean_text(page.text, preserve_structure=True)
+        pages.append(page.text)
+        if page.failed:
+            failed.append(page.page_no)
+        yield page
+    if not failed:
+        put(digest, enable_ocr, {"text": join_pages(pages), "pages": pages, "failed_pages": []})
@@ -0,0 +1,108 @@
+# app/services/extractive.py
+import os
+from typing import List, Dict, Any, Tuple
+import numpy as np
+from app.services.nlp import split_sentences
+from app.services import embedding_service
+
+# Extractive summaries: sentences are ranked by TextRank-style centrality on a cosine
+# similarity graph of their (already normalized) MiniLM embeddings, and the top ones are
+# returned in document order. No generator involved, so it answers in milliseconds.
+EXTRACTIVE_SENTENCES = int(os.environ.get("EXTRACTIVE_SENTENCES", "5"))
+EXTRACTIVE_MIN_WORDS = int(os.environ.get("EXTRACTIVE_MIN_WORDS", "4"))      # skip headings/fragments
+EXTRACTIVE_DENSE_MAX = int(os.environ.get("EXTRACTIVE_DENSE_MAX", "3000"))   # n x n matrix up to this
+_DAMPING = 0.85
+_ITERATIONS = 50
+_TOL = 1e-6
+
+
+def _candidates(text: str) -> List[str]:
+    return [s for s in split_sentences(text) if len(s.split()) >= EXTRACTIVE_MIN_WORDS]
+
+
+def _pagerank(matvec, n: int) -> np.ndarray:
+    scores = np.full(n, 1.0 / n, dtype="float32")
+    for _ in range(_ITERATIONS):
+        nxt = (1 - _DAMPING) / n + _DAMPING * matvec(scores)
+        if np.abs(nxt - scores).sum() < _TOL:
+            return nxt
+        scores = nxt
+    return scores
+
+
+def rank_sentences(embeddings: np.ndarray) -> np.ndarray:
+    """Centrality score per sentence (rows are L2-normalized embeddings)."""
+    n = len(embeddings)
+    if n <= 2:
+        return np.ones(n, dtype="float32")
+    # edge weight sim = (1 + cos) / 2 in [0, 1], self-loops removed. Unlike clipping negative
+    # cosines to 0 this is low-rank plus a constant, so both paths below use the same graph
+    e = embeddings
+    col_sums = (n + e @ e.sum(axis=0)) / 2 - 1.0  # minus the diagonal, (1 + 1) / 2
+    col_sums[col_sums <= 0] = 1.0
+    if n <= EXTRACTIVE_DENSE_MAX:
+        sim = (1.0 + e @ e.T) / 2
+        np.fill_diagonal(sim, 0.0)
+        trans = sim / col_sums  # column-stochastic: each sentence spreads its score over its neighbours
+        return _pagerank(lambda x: trans @ x, n)
+
+    # very long texts: the same product as sim @ (x / col_sums), without the n x n matrix
+    def matvec(x):
+        y = x / col_sums
+        return (y.sum() + e @ (e.T @ y)) / 2 - y
+    return _pagerank(matvec, n)
+
+
+def _pick(sentences: List[str], embeddings: np.ndarray, n_sentences: int) -> List[Tuple[int, str, float]]:
+    if not sentences:
+        return []
+    scores = rank_sentences(embeddings)
+    best = np.argsort(-scores, kind="stable")[:max(n_sentences, 0)]
+    return [(int(i), sentences[i], float(scores[i])) for i in sorted(best)]
+
+
+def top_sentences(text: str, n_sentences: int = EXTRACTIVE_SENTENCES) -> List[Tuple[int, str, float]]:
+    """The n_sentences most central sentences as (position, sentence, score), in document order."""
+    sentences = _candidates(text)
+    return _pick(sentences, embedding_service.encode(sentences), n_sentences)
+
+
+def _as_summary(picked: List[Tuple[int, str, float]]) -> Dict[str, Any]:
+    return {"summary": " ".join(s for _, s, _ in picked),
+            "sentences": [{"position": i, "text": s, "score": round(sc, 6)} for i, s, sc in picked]}
+
+
+def extractive_summary(text: str, n_sentences: int = EXTRACTIVE_SENTENCES) -> Dict[str, Any]:
+    return _as_summary(top_sentences(text, n_sentences))
+
+
+def extractive_summaries(texts: List[str], n_sentences: int = EXTRACTIVE_SENTENCES) -> List[Dict[str, Any]]:
+    """extractive_summary for many texts (e.g. sections) with a single embedding call."""
+    per_text = [_candidates(t or "") for t in texts]
+    embeddings = embedding_service.encode([s for sents in per_text for s in sents])
+    out, start = [], 0
+    for sents in per_text:
+        out.append(_as_summary(_pick(sents, embeddings[start:start + len(sents)], n_sentences)))
+        start += len(sents)
+    return out
+
+
+def prefilter(text: str, max_tokens: int, tokenizer) -> str:
+    """
+    Shrink text to at most max_tokens (by the given tokenizer) by keeping its most central
+    sentences, in document order. Text that already fits is returned unchanged.
+    """
+    if len(tokenizer(text, add_special_tokens=False)["input_ids"]) <= max_tokens:
+        return text
+    sentences = _candidates(text)
+    if not sentences:
+        return text
+    scores = rank_sentences(embedding_service.encode(sentences))
+    lengths = [len(ids) for ids in tokenizer(sentences, add_special_tokens=False)["input_ids"]]
+    kept, used = [], 0
+    for i in np.argsort(-scores, kind="stable"):
+        extra = lengths[i] + (1 if kept else 0)  # the joining space
+        if used + extra <= max_tokens:
+            kept.append(int(i))
+            used += extra
+    return " ".join(sentences[i] for i in sorted(kept))
@@ -1,24 +1,75 @@
 import fitz  # PyMuPDF
 import docx
-import pytesseract
-from PIL import Image
 from app.services.cleaner import clean_text
-from concurrent.futures import ProcessPoolExecutor
+from app.services import ocr_pool
+from collections import deque
+from dataclasses import dataclass
+from typing import List, Dict, Any, Iterator
+import os
 
-def extract_text_pdf(path: str) -> str:
-    """Extract text from a normal PDF."""
-    text = ""
-    with fitz.open(path) as pdf:
-        for page in pdf:
-            text += page.get_text()
-    return text
+# Bump when extraction/cleaning output changes, so cached results are not reused.
+EXTRACTOR_VERSION = "3"
+
+# File extensions iter_pages() can read; anything else raises ValueError.
+SUPPORTED_TYPES = ("pdf", "docx", "txt")
+
+# Pages are cleaned individually and joined with a paragraph break.
+PAGE_SEPARATOR = "\n\n"
+
+# A PDF page is OCR'd when it has fewer native characters than OCR_MIN_CHARS
+# and embedded images cover at least OCR_IMAGE_COVERAGE of its area.
+OCR_MIN_CHARS = int(os.environ.get("OCR_MIN_CHARS", "50"))
+OCR_IMAGE_COVERAGE = float(os.environ.get("OCR_IMAGE_COVERAGE", "0.5"))
+
+@dataclass
+class PageText:
+    page_no: int      # 1-based
+    text: str
+    ocr: bool = False
+    failed: bool = False  # OCR failed or timed out; text is empty but not genuinely blank
+
+def _page_needs_ocr(page, text: str) -> bool:
+    if len(text.strip()) >= OCR_MIN_CHARS:
+        return False
+    page_area = abs(page.rect)
+    if not page_area:
+        return False
+    covered = 0.0
+    for info in page.get_image_info():
+        covered += abs(fitz.Rect(info["bbox"]) & page.rect)
+    return min(covered / page_area, 1.0) >= OCR_IMAGE_COVERAGE
+
+def _set_ocr_text(pt: PageText, text):
+    pt.text, pt.failed = text or "", text is None
 
-def ocr_scanned_pdf(path: str, max_workers: int = 4) -> str:
-    """Run OCR on scanned PDFs with multiprocessing."""
+def iter_pdf_pages(path: str, enable_ocr: bool = True) -> Iterator[PageText]:
+    """
+    Yield PDF pages one at a time, in order, OCR-ing only the pages that look scanned.
+    Scanned pages are sent to the shared OCR pool while native pages keep being read.
+    """
     with fitz.open(path) as pdf:
-        with ProcessPoolExecutor(max_workers=max_workers) as executor:
-            texts = list(executor.map(_ocr_page_image, pdf))
-    return "\n".join(texts)
+        pending = deque()  # (PageText, Future or None), in page order
+        inflight = 0
+        for i, page in enumerate(pdf):
+            text = page.get_text()
+            if enable_ocr and _page_needs_ocr(page, text):
+                pending.append((PageText(page_no=i + 1, text="", ocr=True), ocr_pool.submit_page(path, i + 1)))
+                inflight += 1
+            else:
+                pending.append((PageText(page_no=i + 1, text=text), None))
+            # emit ready pages; once this document's OCR window is full, wait on the oldest
+            while pending and (pending[0][1] is None or pending[0][1].done()
+                               or inflight >= ocr_pool.OCR_PER_REQUEST):
+                pt, fut = pending.popleft()
+                if fut is not None:
+                    _set_ocr_text(pt, ocr_pool.page_result(fut, pt.page_no))
+                    inflight -= 1
+                yield pt
+        while pending:
+            pt, fut = pending.popleft()
+            if fut is not None:
+                _set_ocr_text(pt, ocr_pool.page_result(fut, pt.page_no))
+            yield pt
 
 def extract_text_docx(path: str) -> str:
     """Extract text from DOCX files."""
@@ -30,22 +81,30 @@ def extract_text_txt(path: str) -> str:
     with open(path, "r", encoding="utf-8") as f:
         return f.read()
 
-def extract_and_clean(path: str, ext: str, enable_ocr: bool = True) -> str:
+def iter_pages(path: str, ext: str, enable_ocr: bool = True) -> Iterator[PageText]:
+    """Raw text page by page; non-paginated formats yield a single page."""
     ext = ext.lower()
     if ext == "pdf":
-        text = extract_text_pdf(path)
-        if enable_ocr and not text.strip():  # Only OCR if empty
-            text = ocr_scanned_pdf(path)
+        yield from iter_pdf_pages(path, enable_ocr)
     elif ext == "docx":
-        text = extract_text_docx(path)
+        yield PageText(page_no=1, text=extract_text_docx(path))
     elif ext == "txt":
-        text = extract_text_txt(path)
+        yield PageText(page_no=1, text=extract_text_txt(path))
     else:
         raise ValueError("Unsupported file type")
-    return clean_text(text)
 
+def join_pages(pages: List[str]) -> str:
+    """Full document text from cleaned pages (empty pages are skipped)."""
+    return PAGE_SEPARATOR.join(p for p in pages if p)
 
-def _ocr_page_image(page):
-    pix = page.get_pixmap()
-    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-    return pytesseract.image_to_string(img)
\ No newline at end of file
+def extract_document(path: str, ext: str, enable_ocr: bool = True) -> Dict[str, Any]:
+    """
+    Cleaned full text plus cleaned per-page text:
+    {"text": str, "pages": [str], "failed_pages": [page numbers whose OCR failed]}.
+    """
+    pages, failed = [], []
+    for p in iter_pages(path, ext, enable_ocr):
+        pages.append(clean_text(p.text, preserve_structure=True))
+        if p.failed:
+            failed.append(p.page_no)
+    return {"text": join_pages(pages), "pages": pages, "failed_pages": failed}
@@ -0,0 +1,53 @@
+# app/services/generation.py
+import os
+import threading
+from typing import Iterator
+import torch
+from transformers import TextIteratorStreamer, StoppingCriteria, StoppingCriteriaList
+
+# seconds to wait for the next token before giving up on a stalled generation
+STREAM_TOKEN_TIMEOUT = float(os.environ.get("STREAM_TOKEN_TIMEOUT", "120"))
+
+
+class _Cancelled(StoppingCriteria):
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        return self.event.is_set()
+
+
+def stream_generate(pipe, prompt: str, **gen_kwargs) -> Iterator[str]:
+    """
+    Run pipe.model.generate in a background thread and yield decoded text pieces as
+    tokens are produced. Closing the iterator (e.g. the client disconnected) stops
+    generation at the next token.
+    """
+    tokenizer, model = pipe.tokenizer, pipe.model
+    enc = tokenizer(prompt, return_tensors="pt", truncation=True)
+    inputs = {k: enc[k].to(model.device) for k in ("input_ids", "attention_mask") if k in enc}
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True,
+                                    timeout=STREAM_TOKEN_TIMEOUT)
+    cancel = threading.Event()
+    errors = []
+
+    def run():
+        try:
+            with torch.no_grad():
+                model.generate(**inputs, streamer=streamer,
+                               stopping_criteria=StoppingCriteriaList([_Cancelled(cancel)]), **gen_kwargs)
+        except Exception as e:
+            errors.append(e)
+            streamer.end()
+
+    thread = threading.Thread(target=run, name="generate-stream", daemon=True)
+    thread.start()
+    try:
+        for piece in streamer:
+            if piece:
+                yield piece
+    finally:
+        cancel.set()
+        thread.join(timeout=STREAM_TOKEN_TIMEOUT)
+    if errors:
+        raise errors[0]
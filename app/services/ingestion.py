@@ -0,0 +1,286 @@
+# app/services/ingestion.py
+"""
+Background ingestion: extract -> structure -> embed -> persist.
+
+Each stage runs on its own bounded thread pool, so a slow OCR job only occupies an
+extract worker while other jobs keep moving through embedding and persisting.
+Job state lives in the `ingestion_jobs` SQLite table; intermediate stage outputs
+are kept in memory and a job that lost them (e.g. restart) starts over from extract.
+A failed job's outputs are kept for INGEST_FAILED_CONTEXT_TTL seconds so a prompt retry
+resumes at the failed stage; after that they are dropped and a retry starts over.
+"""
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List
+
+from app.db.database import SessionLocal, engine, Base
+from app.db.models import Document, IngestionJob
+from app.services.extraction_cache import iter_pages_cached
+from app.services.extractor import join_pages
+from app.services.structure import detect_sections, sections_to_json
+from app.services.embeddings_store import embed_texts, add_texts, delete_document_vectors
+from app.services.documents import persist_sections, clear_sections, assign_sections
+from app.services.chunker import chunk_pages
+from app.services import summary_store
+
+STAGES = ["extract", "structure", "embed", "persist"]
+STAGE_WORKERS = {
+    "extract": int(os.environ.get("INGEST_EXTRACT_WORKERS", "2")),
+    "structure": int(os.environ.get("INGEST_STRUCTURE_WORKERS", "1")),
+    "embed": int(os.environ.get("INGEST_EMBED_WORKERS", "1")),
+    "persist": 1,  # single writer for SQLite + FAISS
+}
+MAX_STAGE_RETRIES = int(os.environ.get("INGEST_MAX_RETRIES", "2"))
+RETRY_BACKOFF = float(os.environ.get("INGEST_RETRY_BACKOFF", "2.0"))  # seconds, doubled per attempt
+FAILED_CONTEXT_TTL = float(os.environ.get("INGEST_FAILED_CONTEXT_TTL", "600"))  # seconds
+
+Base.metadata.create_all(bind=engine)
+
+_pools: Dict[str, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+# job_id -> stage outputs (pages, text, sections, chunks, metas, embeddings)
+_contexts: Dict[str, Dict[str, Any]] = {}
+_failed_at: Dict[str, float] = {}  # job_id -> when it failed for good (context still held)
+_contexts_lock = threading.Lock()
+
+
+def _pool(stage: str) -> ThreadPoolExecutor:
+    with _pools_lock:
+        if stage not in _pools:
+            _pools[stage] = ThreadPoolExecutor(max_workers=STAGE_WORKERS[stage],
+                                               thread_name_prefix=f"ingest-{stage}")
+        return _pools[stage]
+
+
+def _expire_contexts():
+    """Drop the stage outputs of jobs that failed more than FAILED_CONTEXT_TTL seconds ago."""
+    cutoff = time.monotonic() - FAILED_CONTEXT_TTL
+    with _contexts_lock:
+        for job_id in [j for j, t in _failed_at.items() if t <= cutoff]:
+            del _failed_at[job_id]
+            _contexts.pop(job_id, None)
+
+
+def _job_to_dict(job: IngestionJob) -> Dict[str, Any]:
+    return {
+        "job_id": job.id,
+        "filename": job.filename,
+        "path": job.path,
+        "document_id": job.document_id,
+        "options": json.loads(job.options or "{}"),
+        "status": job.status,
+        "stage": job.stage,
+        "progress": job.progress,
+        "attempts": job.attempts,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+    }
+
+
+def _update_job(job_id: str, **fields):
+    db = SessionLocal()
+    try:
+        job = db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+        if job is None:
+            return
+        for k, v in fields.items():
+            setattr(job, k, v)
+        db.commit()
+    finally:
+        db.close()
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    db = SessionLocal()
+    try:
+        job = db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+        return _job_to_dict(job) if job else None
+    finally:
+        db.close()
+
+
+def list_jobs(limit: int = 50) -> List[Dict[str, Any]]:
+    db = SessionLocal()
+    try:
+        jobs = db.query(IngestionJob).order_by(IngestionJob.created_at.desc()).limit(limit).all()
+        return [_job_to_dict(j) for j in jobs]
+    finally:
+        db.close()
+
+
+# ---- stages -------------------------------------------------------------
+
+def _stage_extract(job: Dict[str, Any], ctx: Dict[str, Any]):
+    if not job["options"].get("extract", True):
+        ctx["pages"], ctx["text"] = [], None
+        return
+    ext = os.path.splitext(job["filename"])[-1].replace(".", "")
+    pages, failed = [], []
+    for page in iter_pages_cached(job["path"], ext, job["options"].get("sha256")):
+        pages.append((page.page_no, page.text))
+        if page.failed:
+            failed.append(page.page_no)
+    if failed:
+        # not cached either; raising sends the stage through the normal retry/backoff
+        raise RuntimeError(f"OCR failed on pages {failed}")
+    ctx["pages"] = pages
+    ctx["text"] = join_pages([t for _, t in pages])
+
+
+def _stage_structure(job: Dict[str, Any], ctx: Dict[str, Any]):
+    text = ctx.get("text")
+    if text and job["document_id"] is not None:
+        ctx["sections"] = sections_to_json(detect_sections(text))
+    else:
+        ctx["sections"] = []
+
+
+def _stage_embed(job: Dict[str, Any], ctx: Dict[str, Any]):
+    ctx["chunks"], ctx["metas"], ctx["embeddings"] = [], [], None
+    if not (job["options"].get("create_embeddings", True) and ctx.get("text")):
+        return
+    # token-bounded chunks that keep their page number and offsets into the document text
+    chunks = chunk_pages(ctx["pages"])
+    ctx["chunks"] = [c.text for c in chunks]
+    # the text itself is resolved from Document.text by offsets, not stored twice
+    ctx["metas"] = [c.to_metadata(job["filename"], job["document_id"],
+                                  include_text=job["document_id"] is None) for c in chunks]
+    if ctx["chunks"]:
+        ctx["embeddings"] = embed_texts(ctx["chunks"])
+
+
+def _stage_persist(job: Dict[str, Any], ctx: Dict[str, Any]):
+    doc_id = job["document_id"]
+    sections = []
+    if doc_id is not None:
+        db = SessionLocal()
+        try:
+            doc = db.query(Document).filter(Document.id == doc_id).first()
+            if doc is None:
+                raise RuntimeError(f"Document {doc_id} was deleted before ingestion finished")
+            doc.text = ctx.get("text") or ""
+            clear_sections(db, doc_id)  # idempotent on retry
+            sections = persist_sections(db, doc_id, ctx.get("sections") or [])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        summary_store.invalidate(doc_id)  # re-ingested: text and section ids changed
+    # vectors last: a failure here leaves nothing half-added, so the stage can simply rerun;
+    # the document's previous vectors (re-ingest, or a rerun after add_texts) go first
+    if doc_id is not None:
+        delete_document_vectors(doc_id)
+    if ctx.get("chunks"):
+        assign_sections(ctx["metas"], ctx["text"], sections)  # chunk -> section link is stored with it
+        add_texts(ctx["chunks"], ctx["metas"], embeddings=ctx["embeddings"])
+    if doc_id is not None and job["options"].get("summarize"):
+        summary_store.schedule(doc_id)  # off the ingestion pools: the job completes without waiting
+
+
+_STAGE_FUNCS = {
+    "extract": _stage_extract,
+    "structure": _stage_structure,
+    "embed": _stage_embed,
+    "persist": _stage_persist,
+}
+
+
+# ---- scheduling ---------------------------------------------------------
+
+def _submit(job_id: str, stage: str):
+    _pool(stage).submit(_run_stage, job_id, stage)
+
+
+def _run_stage(job_id: str, stage: str):
+    job = get_job(job_id)
+    if job is None:
+        return
+    _expire_contexts()
+    with _contexts_lock:
+        _failed_at.pop(job_id, None)
+        ctx = _contexts.setdefault(job_id, {})
+    _update_job(job_id, status="running", stage=stage)
+    try:
+        _STAGE_FUNCS[stage](job, ctx)
+    except Exception as e:
+        attempts = job["attempts"] + 1
+        print(f"[WARN] ingestion job {job_id} stage '{stage}' failed (attempt {attempts}): {e}")
+        # ValueError is deterministic (e.g. unsupported or malformed input): retrying cannot help
+        if attempts <= MAX_STAGE_RETRIES and not isinstance(e, ValueError):
+            _update_job(job_id, status="queued", attempts=attempts, error=f"{stage}: {e}")
+            timer = threading.Timer(RETRY_BACKOFF * (2 ** (attempts - 1)), _submit, args=(job_id, stage))
+            timer.daemon = True
+            timer.start()
+        else:
+            with _contexts_lock:
+                _failed_at[job_id] = time.monotonic()  # kept for a retry_job, until it expires
+            _update_job(job_id, status="failed", attempts=attempts, error=f"{stage}: {e}")
+        return
+
+    idx = STAGES.index(stage)
+    progress = (idx + 1) / len(STAGES)
+    if idx + 1 < len(STAGES):
+        nxt = STAGES[idx + 1]
+        _update_job(job_id, status="queued", stage=nxt, progress=progress, attempts=0, error=None)
+        _submit(job_id, nxt)
+    else:
+        with _contexts_lock:
+            _contexts.pop(job_id, None)
+        _update_job(job_id, status="completed", progress=1.0, attempts=0, error=None)
+
+
+def submit_job(filename: str, path: str, document_id: Optional[int] = None,
+               options: Optional[Dict[str, Any]] = None) -> str:
+    """Register an ingestion job and queue its first stage. Returns the job id."""
+    job_id = uuid.uuid4().hex
+    db = SessionLocal()
+    try:
+        db.add(IngestionJob(id=job_id, filename=filename, path=path, document_id=document_id,
+                            options=json.dumps(options or {}), status="queued", stage=STAGES[0],
+                            progress=0.0, attempts=0))
+        db.commit()
+    finally:
+        db.close()
+    _submit(job_id, STAGES[0])
+    return job_id
+
+
+def retry_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Re-queue a failed job from the stage that failed (or from extract if its context expired)."""
+    job = get_job(job_id)
+    if job is None:
+        return None
+    if job["status"] != "failed":
+        raise ValueError(f"Job is {job['status']}; only failed jobs can be retried")
+    _expire_contexts()
+    stage = job["stage"] if job_id in _contexts else STAGES[0]
+    _update_job(job_id, status="queued", stage=stage, attempts=0, error=None)
+    _submit(job_id, stage)
+    return get_job(job_id)
+
+
+def resume_jobs():
+    """Re-queue jobs interrupted by a shutdown. Their in-memory context is gone, so start at extract."""
+    db = SessionLocal()
+    try:
+        pending = [j.id for j in db.query(IngestionJob)
+                   .filter(IngestionJob.status.in_(["queued", "running"])).all()]
+    finally:
+        db.close()
+    for job_id in pending:
+        _update_job(job_id, status="queued", stage=STAGES[0], progress=0.0, attempts=0)
+        _submit(job_id, STAGES[0])
+
+
+def shutdown():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _pools.clear()
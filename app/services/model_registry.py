@@ -0,0 +1,95 @@
+# app/services/model_registry.py
+import os
+import copy
+import threading
+from typing import Dict, Any, Tuple
+import torch
+from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, pipeline
+
+# Seq2seq models are loaded once per name and shared by QA and summarization through
+# one text2text pipeline. Task defaults (T5's "summarize: " prefix, beam settings) are
+# read from the config and passed per call instead of being written into the shared config.
+# Every call through a shared pipeline (and stream_generate) tokenizes with truncation=True,
+# so its tokenizer's settings never flip between threads; counting uses get_tokenizer().
+GEN_INT8 = os.environ.get("GEN_INT8", "0").lower() in ("1", "true", "yes")  # CPU only
+TORCH_NUM_THREADS = int(os.environ.get("TORCH_NUM_THREADS", "0"))           # 0 -> torch default
+GEN_WARMUP = os.environ.get("GEN_WARMUP", "1").lower() in ("1", "true", "yes")
+
+_lock = threading.Lock()
+_pipelines: Dict[str, Any] = {}
+_tokenizers: Dict[str, Any] = {}
+_threads_set = False
+
+
+def _device() -> str:
+    # dynamic int8 kernels are CPU-only
+    return "cuda" if torch.cuda.is_available() and not GEN_INT8 else "cpu"
+
+
+def _set_threads():
+    global _threads_set
+    if TORCH_NUM_THREADS and not _threads_set:
+        torch.set_num_threads(TORCH_NUM_THREADS)
+        _threads_set = True
+
+
+def _load(name: str):
+    _set_threads()
+    device = _device()
+    print(f"Loading seq2seq model {name} on {device}{' (int8)' if GEN_INT8 else ''}...")
+    tokenizer = AutoTokenizer.from_pretrained(name)
+    model = AutoModelForSeq2SeqLM.from_pretrained(name, torch_dtype=torch.float32).eval()
+    if GEN_INT8:
+        # int8 weights for every Linear layer; activations are quantized on the fly
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    else:
+        model = model.to(device)
+    return pipeline("text2text-generation", model=model, tokenizer=tokenizer,
+                    device=0 if device == "cuda" else -1)
+
+
+def get_pipeline(name: str):
+    """The shared text2text pipeline for a model, loading it on first use."""
+    with _lock:
+        if name not in _pipelines:
+            _pipelines[name] = _load(name)
+        return _pipelines[name]
+
+
+def get_tokenizer(name: str):
+    """
+    A private copy of a model's tokenizer for counting/chunking in request threads. The
+    pipeline's own tokenizer is switched to truncation by generation calls, and HF fast
+    tokenizers raise "Already borrowed" when one thread changes those settings while
+    another is encoding; this copy only ever runs untruncated and unpadded.
+    """
+    pipe = get_pipeline(name)
+    with _lock:
+        if name not in _tokenizers:
+            tokenizer = copy.deepcopy(pipe.tokenizer)
+            tokenizer("")  # settle its truncation/padding state once, before it is shared
+            _tokenizers[name] = tokenizer
+        return _tokenizers[name]
+
+
+def task_defaults(name: str, task: str) -> Tuple[str, Dict[str, Any]]:
+    """(input prefix, generate kwargs) the model's config recommends for a task, e.g. summarization."""
+    params = dict((get_pipeline(name).model.config.task_specific_params or {}).get(task, {}))
+    prefix = params.pop("prefix", "") or ""
+    params.pop("max_length", None)  # callers pass max_new_tokens
+    return prefix, params
+
+
+def warm_up(*names: str):
+    """Load each distinct model and run one short generation so first requests don't pay for it."""
+    for name in dict.fromkeys(names):
+        try:
+            get_pipeline(name)("warm up", truncation=True, max_new_tokens=1, do_sample=False)
+        except Exception as e:
+            print(f"[WARN] Warm-up of {name} failed: {e}")
+
+
+def info() -> Dict[str, Any]:
+    with _lock:
+        return {"loaded": list(_pipelines), "int8": GEN_INT8, "device": _device(),
+                "torch_threads": torch.get_num_threads()}
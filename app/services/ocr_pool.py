@@ -0,0 +1,94 @@
+# app/services/ocr_pool.py
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+import fitz  # PyMuPDF
+import pytesseract
+from PIL import Image
+
+# One long-lived pool for the whole app. Workers get (path, page_no, dpi) and open
+# the document themselves, so nothing PyMuPDF-specific is pickled across processes.
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", str(os.cpu_count() or 2)))
+OCR_DPI = int(os.environ.get("OCR_DPI", "200"))
+OCR_GRAYSCALE = os.environ.get("OCR_GRAYSCALE", "1").lower() in ("1", "true", "yes")
+OCR_MAX_INFLIGHT = int(os.environ.get("OCR_MAX_INFLIGHT", str(OCR_WORKERS * 2)))  # all callers
+OCR_PER_REQUEST = int(os.environ.get("OCR_PER_REQUEST", str(OCR_WORKERS)))        # one caller
+OCR_PAGE_TIMEOUT = float(os.environ.get("OCR_PAGE_TIMEOUT", "120"))              # seconds
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(OCR_MAX_INFLIGHT)
+
+
+def _ocr_page(path: str, page_no: int, dpi: int, grayscale: bool, timeout: float) -> str:
+    """Runs inside a worker process: render one page and OCR it."""
+    with fitz.open(path) as pdf:
+        page = pdf[page_no - 1]
+        pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY if grayscale else fitz.csRGB, alpha=False)
+        img = Image.frombytes("L" if grayscale else "RGB", [pix.width, pix.height], pix.samples)
+    # tesseract runs as a subprocess; its own timeout kills it instead of wedging the worker
+    return pytesseract.image_to_string(img, timeout=timeout)
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: forking a multi-threaded server process is not safe
+            _executor = ProcessPoolExecutor(max_workers=OCR_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def submit_page(path: str, page_no: int, dpi: Optional[int] = None,
+                grayscale: Optional[bool] = None) -> Future:
+    """
+    Queue one page for OCR. Blocks while OCR_MAX_INFLIGHT pages are already
+    queued or running across all callers.
+    """
+    dpi = dpi or OCR_DPI
+    grayscale = OCR_GRAYSCALE if grayscale is None else grayscale
+    _slots.acquire()
+    try:
+        try:
+            fut = get_executor().submit(_ocr_page, path, page_no, dpi, grayscale, OCR_PAGE_TIMEOUT)
+        except BrokenProcessPool:
+            _reset_executor()
+            fut = get_executor().submit(_ocr_page, path, page_no, dpi, grayscale, OCR_PAGE_TIMEOUT)
+    except Exception:
+        _slots.release()
+        raise
+    fut.add_done_callback(lambda _: _slots.release())
+    return fut
+
+
+def page_result(fut: Future, page_no: int) -> Optional[str]:
+    """Text of a submitted page; None if it failed or timed out (so it is never cached as empty)."""
+    try:
+        # a little slack on top of the tesseract timeout for rendering
+        return fut.result(timeout=OCR_PAGE_TIMEOUT + 30)
+    except FuturesTimeout:
+        fut.cancel()
+        print(f"[WARN] OCR timed out on page {page_no}")
+    except BrokenProcessPool:
+        _reset_executor()
+        print(f"[WARN] OCR worker died on page {page_no}")
+    except Exception as e:
+        print(f"[WARN] OCR failed on page {page_no}: {e}")
+    return None
+
+
+def shutdown():
+    _reset_executor()
@@ -0,0 +1,171 @@
+# app/services/onnx_embedder.py
+"""
+ONNX Runtime backend for the sentence embedding model (EMB_BACKEND=onnx).
+
+The first load exports the transformer to ONNX next to its tokenizer, applies
+dynamic int8 quantization, and keeps both files under BASE_DIR/onnx_models.
+Pooling and normalization are done in numpy, matching SentenceTransformer.
+
+    python -m app.services.onnx_embedder --check   # cosine parity against PyTorch
+"""
+import os
+import re
+import json
+import inspect
+import argparse
+from typing import List, Dict, Any, Optional
+import numpy as np
+from app.config import BASE_DIR
+
+ONNX_DIR = os.path.join(BASE_DIR, "onnx_models")
+ONNX_QUANTIZE = os.environ.get("EMB_ONNX_QUANTIZE", "1").lower() in ("1", "true", "yes")
+ONNX_THREADS = int(os.environ.get("EMB_ONNX_THREADS", "0"))  # intra-op threads; 0 -> onnxruntime default
+ONNX_OPSET = 14
+
+_PARITY_TEXTS = [
+    "The contract terminates automatically after twelve months unless renewed in writing.",
+    "Install the package, then run the migration script before starting the server.",
+    "Quarterly revenue grew by 14 percent, driven mainly by subscription sales.",
+    "Patients were randomized into two groups and followed for six weeks.",
+    "Section 3.2 describes the calibration procedure for the pressure sensor.",
+    "short",
+]
+
+
+def _model_dir(model_name: str) -> str:
+    return os.path.join(ONNX_DIR, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+
+
+def export(model_name: str, out_dir: Optional[str] = None) -> str:
+    """Export the SentenceTransformer's transformer to ONNX (+ int8 copy). Needs torch."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    out_dir = out_dir or _model_dir(model_name)
+    os.makedirs(out_dir, exist_ok=True)
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer, pooling = st[0], st[1]
+    # sentence-transformers >= 3 exposes the mode directly; 2.x only through the helper
+    mode = getattr(pooling, "pooling_mode", None) or pooling.get_pooling_mode_str()
+    if mode not in ("mean", "cls"):
+        raise ValueError(f"Unsupported pooling mode for ONNX export: {mode}")
+    tokenizer = transformer.tokenizer
+    hf_model = transformer.auto_model.eval()
+
+    dummy = tokenizer(["export sample text"], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in dummy]
+
+    class _Wrapper(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *args):
+            return self.model(**dict(zip(input_names, args))).last_hidden_state
+
+    fp32_path = os.path.join(out_dir, "model.onnx")
+    axes = {n: {0: "batch", 1: "seq"} for n in input_names + ["last_hidden_state"]}
+    # newer torch defaults to the dynamo exporter (needs onnxscript); the TorchScript one suffices here
+    extra = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(_Wrapper(hf_model), tuple(dummy[n] for n in input_names), fp32_path,
+                          input_names=input_names, output_names=["last_hidden_state"],
+                          dynamic_axes=axes, opset_version=ONNX_OPSET, **extra)
+    tokenizer.save_pretrained(out_dir)
+    with open(os.path.join(out_dir, "embedder.json"), "w") as f:
+        json.dump({"model": model_name, "pooling": mode,
+                   "max_seq_length": st.max_seq_length,
+                   "dim": st.get_sentence_embedding_dimension()}, f)
+
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantize_dynamic(fp32_path, os.path.join(out_dir, "model.int8.onnx"), weight_type=QuantType.QInt8)
+    return out_dir
+
+
+class OnnxEmbedder:
+    """Drop-in for the parts of SentenceTransformer the app uses (encode, tokenizer, limits)."""
+
+    def __init__(self, model_dir: str, quantized: bool = True, threads: int = 0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(model_dir, "embedder.json")) as f:
+            self.config = json.load(f)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+        opts.inter_op_num_threads = 1
+        path = os.path.join(model_dir, "model.int8.onnx" if quantized else "model.onnx")
+        self.session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_seq_length = self.config["max_seq_length"]
+        self.pooling = self.config["pooling"]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config["dim"]
+
+    def _pool(self, hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        if self.pooling == "cls":
+            return hidden[:, 0]
+        mask = mask[..., None].astype("float32")
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, texts: List[str], batch_size: int = 32, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        # length-sorted batches keep padding (and wasted FLOPs) small
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        out = np.zeros((len(texts), self.get_sentence_embedding_dimension()), dtype="float32")
+        for i in range(0, len(texts), batch_size):
+            idx = order[i:i + batch_size]
+            enc = self.tokenizer([texts[j] for j in idx], padding=True, truncation=True,
+                                 max_length=self.max_seq_length, return_tensors="np")
+            feed = {n: enc[n].astype("int64") for n in self.input_names}
+            hidden = self.session.run(None, feed)[0]
+            out[idx] = self._pool(hidden, enc["attention_mask"])
+        if normalize_embeddings:
+            out /= np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+        return out
+
+
+def load(model_name: str) -> OnnxEmbedder:
+    model_dir = _model_dir(model_name)
+    needed = "model.int8.onnx" if ONNX_QUANTIZE else "model.onnx"
+    if not os.path.exists(os.path.join(model_dir, needed)):
+        print(f"[INFO] Exporting {model_name} to ONNX in {model_dir}...")
+        export(model_name, model_dir)
+    return OnnxEmbedder(model_dir, quantized=ONNX_QUANTIZE, threads=ONNX_THREADS)
+
+
+def parity_check(model_name: str, texts: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Cosine agreement between PyTorch and ONNX embeddings of the same texts."""
+    from sentence_transformers import SentenceTransformer
+    texts = texts or _PARITY_TEXTS
+    ref = SentenceTransformer(model_name, device="cpu").encode(texts, convert_to_numpy=True,
+                                                               normalize_embeddings=True)
+    got = load(model_name).encode(texts, normalize_embeddings=True)
+    cos = (ref * got).sum(axis=1)
+    return {"quantized": ONNX_QUANTIZE, "min_cosine": float(cos.min()), "mean_cosine": float(cos.mean())}
+
+
+def main():
+    from app.services.embedding_service import EMB_MODEL
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=EMB_MODEL)
+    parser.add_argument("--export", action="store_true", help="(re-)export the model and exit")
+    parser.add_argument("--check", action="store_true", help="compare against PyTorch output")
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    args = parser.parse_args()
+
+    if args.export:
+        print(export(args.model))
+    if args.check:
+        report = parity_check(args.model)
+        print(json.dumps(report, indent=2))
+        if report["min_cosine"] < args.min_cosine:
+            raise SystemExit(f"Parity check failed: min cosine {report['min_cosine']:.4f} < {args.min_cosine}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,65 +1,145 @@
 # app/services/qa.py
-from typing import List, Dict, Any
-from app.services.embeddings_store import search, add_texts
-from app.services.summarizer import get_summarizer, summarize_text
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, pipeline
-import torch
+from typing import List, Dict, Any, Optional, Iterator
+from app.services.embeddings_store import search, search_batch, add_texts, embed_query, embed_queries, index_version
+from app.services import answer_cache
+from app.services.generation import stream_generate
+from app.services import model_registry
+from app.services.context_builder import build_context, prompt_template
 import os
 
 # generator model — can be same as summarizer model or another generator model you fine-tuned.
+# Loaded through model_registry, so the default flan-t5 is shared with the summarizer.
 GEN_MODEL = os.environ.get("GEN_MODEL", "google/flan-t5-base")
-DEVICE = 0 if torch.cuda.is_available() else "cpu"  # pipeline accepts "cpu" directly
-
-_generator = None
+QA_BATCH_SIZE = int(os.environ.get("QA_BATCH_SIZE", "8"))  # prompts per padded generate call
 
 def get_generator():
-    global _generator
-    if _generator is None:
-        print(f"Loading QnA model {GEN_MODEL} on {DEVICE}...")
-        # Force-load model + tokenizer on CPU
-        model = AutoModelForSeq2SeqLM.from_pretrained(
-            GEN_MODEL,
-            torch_dtype=torch.float32,
-            device_map=None
-        ).to("cpu")
-        tokenizer = AutoTokenizer.from_pretrained(GEN_MODEL)
-        _generator = pipeline(
-            "text2text-generation",
-            model=model,
-            tokenizer=tokenizer,
-            device=-1  # force CPU for pipeline
-        )
-    return _generator
-
-
-def retrieve_and_answer(query: str, top_k: int = 5, max_input_len: int = 1000) -> Dict[str, Any]:
+    return model_registry.get_pipeline(GEN_MODEL)
+
+
+def _scope(top_k, max_context_tokens, nprobe, ef_search, doc_ids, source) -> tuple:
+    return (tuple(sorted(doc_ids)) if doc_ids is not None else None, source, top_k,
+            max_context_tokens, nprobe, ef_search)
+
+
+def _build_prompt(query: str, hits: List[Dict[str, Any]], max_context_tokens: Optional[int]):
+    """Token-budgeted prompt from the retrieved passages, plus the sources actually used."""
+    context, sources, _ = build_context(query, hits, model_registry.get_tokenizer(GEN_MODEL), max_context_tokens)
+    return prompt_template(context, query), sources
+
+
+def retrieve_and_answer(query: str, top_k: int = 5, max_context_tokens: Optional[int] = None,
+                        nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                        doc_ids: Optional[List[int]] = None, source: Optional[str] = None) -> Dict[str, Any]:
     """
-    1) Search FAISS for top_k passages
-    2) Build a context string from their texts and metadata
+    1) Search FAISS for top_k passages (only within doc_ids / source when given)
+    2) Pack the best passages into the generator's token budget (max_context_tokens caps
+       the whole prompt; default is the encoder limit), skipping near-duplicates
     3) Use generator to answer the query given the context (prompting)
+    Paraphrases of a recent question in the same scope reuse its answer (answer_cache).
     """
-    hits = search(query, top_k=top_k)
+    version = index_version()
+    scope = _scope(top_k, max_context_tokens, nprobe, ef_search, doc_ids, source)
+    q_emb = embed_query(query)
+    cached = answer_cache.lookup(q_emb, scope, version)
+    if cached is not None:
+        return cached
+
+    hits = search(query, top_k=top_k, nprobe=nprobe, ef_search=ef_search, doc_ids=doc_ids, source=source)
     if not hits:
         return {"answer": "", "sources": []}
 
-    # build context
-    contexts = []
-    sources = []
-    for h in hits:
-        md = h.get("metadata", {})
-        txt = md.get("text") or md.get("content") or ""
-        snippets = txt.strip()
-        if snippets:
-            contexts.append(snippets)
-            sources.append({"score": h["score"], "metadata": md})
-
-    # join with separators, and truncate if too long
-    context_joined = "\n\n---\n\n".join(contexts)
-    if len(context_joined) > max_input_len:
-        context_joined = context_joined[:max_input_len]
-
-    prompt = f"Context:\n{context_joined}\n\nQuestion: {query}\nAnswer concisely:"
+    prompt, sources = _build_prompt(query, hits, max_context_tokens)
     gen = get_generator()
-    out = gen(prompt, max_new_tokens=256, do_sample=False)
+    out = gen(prompt, truncation=True, max_new_tokens=256, do_sample=False)
     answer = out[0]["generated_text"]
-    return {"answer": answer, "sources": sources}
+    result = {"answer": answer, "sources": sources}
+    if index_version() == version:
+        answer_cache.put(q_emb, scope, version, result)
+    return result
+
+
+def stream_answer(query: str, top_k: int = 5, max_context_tokens: Optional[int] = None,
+                  nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                  doc_ids: Optional[List[int]] = None, source: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming retrieve_and_answer. Yields events:
+    {"event": "sources", "sources": [...]}, then {"event": "token", "text": ...} per
+    generated piece, and finally {"event": "done", "answer": full answer}.
+    """
+    version = index_version()
+    scope = _scope(top_k, max_context_tokens, nprobe, ef_search, doc_ids, source)
+    q_emb = embed_query(query)
+    cached = answer_cache.lookup(q_emb, scope, version)
+    if cached is not None:
+        yield {"event": "sources", "sources": cached["sources"]}
+        if cached["answer"]:
+            yield {"event": "token", "text": cached["answer"]}
+        yield {"event": "done", "answer": cached["answer"], "cached": True}
+        return
+
+    hits = search(query, top_k=top_k, nprobe=nprobe, ef_search=ef_search, doc_ids=doc_ids, source=source)
+    if not hits:
+        yield {"event": "sources", "sources": []}
+        yield {"event": "done", "answer": ""}
+        return
+
+    prompt, sources = _build_prompt(query, hits, max_context_tokens)
+    yield {"event": "sources", "sources": sources}
+    pieces = []
+    for piece in stream_generate(get_generator(), prompt, max_new_tokens=256, do_sample=False):
+        pieces.append(piece)
+        yield {"event": "token", "text": piece}
+    answer = "".join(pieces).strip()
+    if index_version() == version:
+        answer_cache.put(q_emb, scope, version, {"answer": answer, "sources": sources})
+    yield {"event": "done", "answer": answer}
+
+
+def answer_batch(questions: List[Dict[str, Any]], top_k: int = 5, max_context_tokens: Optional[int] = None,
+                 nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                 batch_size: int = QA_BATCH_SIZE) -> List[Dict[str, Any]]:
+    """
+    retrieve_and_answer for many questions ({"question", "doc_ids", "source"} dicts):
+    one encode for all questions, one index search per distinct scope, and generation
+    in padded batches of similar-length prompts. Results are in input order.
+    """
+    version = index_version()
+    queries = [q["question"] for q in questions]
+    scopes = [_scope(top_k, max_context_tokens, nprobe, ef_search, q.get("doc_ids"), q.get("source"))
+              for q in questions]
+    q_embs = embed_queries(queries)
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(questions)
+    todo = []
+    for i, (q_emb, scope) in enumerate(zip(q_embs, scopes)):
+        cached = answer_cache.lookup(q_emb, scope, version)
+        if cached is not None:
+            results[i] = cached
+        else:
+            todo.append(i)
+
+    hits = search_batch([queries[i] for i in todo], top_k, nprobe, ef_search,
+                        [(questions[i].get("doc_ids"), questions[i].get("source")) for i in todo])
+    prompts = []  # (position, prompt, sources)
+    for i, h in zip(todo, hits):
+        if not h:
+            results[i] = {"answer": "", "sources": []}
+            continue
+        prompt, sources = _build_prompt(queries[i], h, max_context_tokens)
+        prompts.append((i, prompt, sources))
+
+    if prompts:
+        gen = get_generator()
+        # similar lengths side by side so each padded batch wastes little compute
+        tokenizer = model_registry.get_tokenizer(GEN_MODEL)
+        lengths = [len(ids) for ids in tokenizer([p for _, p, _ in prompts])["input_ids"]]
+        order = sorted(range(len(prompts)), key=lambda j: lengths[j], reverse=True)
+        outputs = gen([prompts[j][1] for j in order], batch_size=batch_size, truncation=True,
+                      max_new_tokens=256, do_sample=False)
+        for j, out in zip(order, outputs):
+            i, _, sources = prompts[j]
+            out = out[0] if isinstance(out, list) else out
+            results[i] = {"answer": out["generated_text"], "sources": sources}
+            if index_version() == version:
+                answer_cache.put(q_embs[i], scopes[i], version, results[i])
+    return results
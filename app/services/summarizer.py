@@ -1,41 +1,191 @@
 # app/services/summarizer.py
-from typing import Optional, List
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, pipeline
-import torch
+from typing import Optional, List, Iterator, Dict, Any, Tuple
+from collections import deque
+import threading
+import time
 from app.config import BASE_DIR
+from app.services import model_registry
+from app.services.generation import stream_generate
+from app.services.chunker import chunk_text
+from app.services import extractive
 import os
 
 # Choose a default summarization model. You can change to a local path for your fine-tuned model.
 # Examples: "google/flan-t5-base", "facebook/bart-large-cnn", or local path "models/flan-t5-finetuned"
+# When it equals GEN_MODEL, QA and summarization share one loaded copy (model_registry).
 SUMMARIZER_MODEL = os.environ.get("SUMMARIZER_MODEL", "google/flan-t5-base")
-DEVICE = 0 if torch.cuda.is_available() else -1
 
-_tokenizer = None
-_model = None
-_pipeline = None
+# Long documents are summarized map-reduce style: token-bounded chunks are summarized in
+# padded batches, the partial summaries are joined and summarized again, until the text
+# fits one encoder pass and a final pass writes the summary. SUMMARY_MAX_LEVELS is only a
+# safety cap (every level at least halves the text, so it is not reached in practice).
+SUMMARY_CHUNK_TOKENS = int(os.environ.get("SUMMARY_CHUNK_TOKENS", "0"))  # 0 -> encoder limit
+SUMMARY_MAP_TOKENS = int(os.environ.get("SUMMARY_MAP_TOKENS", "150"))    # per-chunk summary length
+SUMMARY_BATCH_SIZE = int(os.environ.get("SUMMARY_BATCH_SIZE", "8"))
+SUMMARY_MAX_LEVELS = int(os.environ.get("SUMMARY_MAX_LEVELS", "10"))
+
+# Batched summaries (map stage, sections) run in buckets of similar token length, each
+# bounded by SUMMARY_BATCH_TOKENS padded input tokens (and SUMMARY_BATCH_SIZE inputs), so
+# short sections are not padded up to long ones. Recent batches are kept for /stats/models.
+SUMMARY_BATCH_TOKENS = int(os.environ.get("SUMMARY_BATCH_TOKENS", "4096"))
+SUMMARY_BATCH_LOG = int(os.environ.get("SUMMARY_BATCH_LOG", "100"))
+
+_batch_lock = threading.Lock()
+_batch_log: deque = deque(maxlen=SUMMARY_BATCH_LOG)
+_batch_totals = {"batches": 0, "inputs": 0, "truncated": 0, "tokens": 0, "padded_tokens": 0, "seconds": 0.0}
 
 def get_summarizer():
-    global _tokenizer, _model, _pipeline
-    if _pipeline is None:
-        # use transformers pipeline for summarization (seq2seq)
-        _pipeline = pipeline("summarization", model=SUMMARIZER_MODEL, device=DEVICE, truncation=True)
-    return _pipeline
+    return model_registry.get_pipeline(SUMMARIZER_MODEL)
+
+def get_tokenizer():
+    """The summarizer's tokenizer for counting/chunking (a copy; see model_registry.get_tokenizer)."""
+    return model_registry.get_tokenizer(SUMMARIZER_MODEL)
+
+def _summary_args(max_length: int, min_length: int) -> Tuple[str, Dict[str, Any]]:
+    """Prefix and generate kwargs: the model's summarization defaults, overridden by ours."""
+    prefix, params = model_registry.task_defaults(SUMMARIZER_MODEL, "summarization")
+    params.update(max_new_tokens=max_length, min_length=min_length, do_sample=False)
+    return prefix, params
 
 def summarize_text(text: str, max_length: int = 150, min_length: int = 30) -> str:
     """
     Summarize a single text chunk. If the text is long, we chunk it outside or let transformers handle.
     """
     summarizer = get_summarizer()
+    prefix, params = _summary_args(max_length, min_length)
     # pipeline will handle long text according to model; for very large docs consider manual chunking
-    out = summarizer(text, max_new_tokens=max_length, min_length=min_length, do_sample=False, clean_up_tokenization_spaces=True)
-    return out[0]["summary_text"]
+    out = summarizer(prefix + text, truncation=True, clean_up_tokenization_spaces=True, **params)
+    return out[0]["generated_text"]
 
-def summarize_sections(sections: List[dict], per_section_max: int = 120) -> List[dict]:
+def stream_summary(text: str, max_length: int = 150, min_length: int = 30) -> Iterator[str]:
+    """Like summarize_text, but yields the summary piece by piece as it is generated."""
+    prefix, params = _summary_args(max_length, min_length)
+    params["num_beams"] = 1  # streamers only support greedy/sampling search
+    for beam_only in ("early_stopping", "length_penalty"):
+        params.pop(beam_only, None)
+    yield from stream_generate(get_summarizer(), prefix + text, **params)
+
+def _encoder_limit(tokenizer) -> int:
+    limit = tokenizer.model_max_length
+    return 512 if not limit or limit > 100_000 else limit  # ~1e30 when the model sets none
+
+def _chunk_budget(prefix: str) -> int:
+    """Tokens of document text per encoder pass, after the task prefix and </s>."""
+    tokenizer = get_tokenizer()
+    budget = _encoder_limit(tokenizer) - len(tokenizer(prefix, add_special_tokens=False)["input_ids"]) - 2
+    return min(SUMMARY_CHUNK_TOKENS, budget) if SUMMARY_CHUNK_TOKENS else budget
+
+def _buckets(lengths: List[int], max_batch_tokens: int, max_batch_size: int) -> List[List[int]]:
+    """Indices grouped longest first so that len(batch) * longest <= max_batch_tokens."""
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches, current = [], []
+    for i in order:
+        # current[0] is the longest of its batch, so it sets the padded width
+        if current and (len(current) >= max_batch_size
+                        or (len(current) + 1) * lengths[current[0]] > max_batch_tokens):
+            batches.append(current)
+            current = []
+        current.append(i)
+    if current:
+        batches.append(current)
+    return batches
+
+def _record_batch(entry: Dict[str, Any]):
+    with _batch_lock:
+        _batch_log.append(entry)
+        for key in ("inputs", "truncated", "tokens", "padded_tokens", "seconds"):
+            _batch_totals[key] += entry[key]
+        _batch_totals["batches"] += 1
+
+def summarize_batch(texts: List[str], max_length: int, min_length: int,
+                    batch_size: int = SUMMARY_BATCH_SIZE,
+                    max_batch_tokens: int = SUMMARY_BATCH_TOKENS) -> List[str]:
     """
-    Summarize multiple sections in batches for better performance.
+    Summaries of many texts, in input order. Inputs are truncated to the encoder limit up
+    front, then run in length-sorted buckets (see _buckets); each bucket is timed.
     """
+    if not texts:
+        return []
     summarizer = get_summarizer()
+    tokenizer = get_tokenizer()
+    prefix, params = _summary_args(max_length, min_length)
+    limit = _encoder_limit(tokenizer)
+    inputs = [prefix + t for t in texts]
+    ids = tokenizer(inputs)["input_ids"]
+    truncated = [len(x) > limit for x in ids]
+    for i in [i for i, t in enumerate(truncated) if t]:
+        # keep room for </s>; the pipeline would otherwise re-truncate per call
+        inputs[i] = tokenizer.decode(ids[i][:limit - 1], skip_special_tokens=True)
+    lengths = [min(len(x), limit) for x in ids]
 
+    summaries = [""] * len(texts)
+    for batch in _buckets(lengths, max_batch_tokens, batch_size):
+        start = time.perf_counter()
+        outputs = summarizer([inputs[i] for i in batch], batch_size=len(batch), truncation=True,
+                             clean_up_tokenization_spaces=True, **params)
+        elapsed = time.perf_counter() - start
+        for i, out in zip(batch, outputs):
+            out = out[0] if isinstance(out, list) else out
+            summaries[i] = out["generated_text"]
+        tokens, width = sum(lengths[i] for i in batch), lengths[batch[0]]
+        _record_batch({"inputs": len(batch), "truncated": sum(truncated[i] for i in batch),
+                       "tokens": tokens, "padded_tokens": width * len(batch) - tokens,
+                       "max_tokens": width, "seconds": round(elapsed, 4)})
+    return summaries
+
+def batch_stats() -> Dict[str, Any]:
+    """Totals and the most recent summarization batches (padding waste = padded_tokens / all tokens)."""
+    with _batch_lock:
+        totals, recent = dict(_batch_totals), list(_batch_log)
+    padded = totals["tokens"] + totals["padded_tokens"]
+    totals["padding_ratio"] = round(totals["padded_tokens"] / padded, 4) if padded else None
+    totals["seconds"] = round(totals["seconds"], 3)
+    return {"max_batch_tokens": SUMMARY_BATCH_TOKENS, "max_batch_size": SUMMARY_BATCH_SIZE,
+            **totals, "recent": recent}
+
+def prefilter_text(text: str) -> str:
+    """The text cut down to its most central sentences that fit one summarizer pass."""
+    prefix, _ = model_registry.task_defaults(SUMMARIZER_MODEL, "summarization")
+    return extractive.prefilter(text, _chunk_budget(prefix), get_tokenizer())
+
+def summarize_long(text: str, max_length: int = 500, min_length: int = 50,
+                   batch_size: int = SUMMARY_BATCH_SIZE, max_levels: int = SUMMARY_MAX_LEVELS,
+                   prefilter: bool = False) -> str:
+    """
+    Hierarchical summary of a document of any length. Each level chunks the current
+    text by summarizer tokens and summarizes all chunks in batches (map); the joined
+    partial summaries become the next level's text (reduce). With prefilter, the text is
+    first cut down to its most central sentences that fit one encoder pass (one generation).
+    """
+    tokenizer = get_tokenizer()
+    prefix, _ = _summary_args(max_length, min_length)
+    budget = _chunk_budget(prefix)
+    if prefilter:
+        text = prefilter_text(text)
+    # a partial summary is at most half its chunk, so every level at least halves the text
+    map_tokens = max(min(SUMMARY_MAP_TOKENS, budget // 2), 1)
+    level = 0
+    n_tokens = len(tokenizer(text, add_special_tokens=False)["input_ids"])
+    while n_tokens > budget and level < max_levels:
+        chunks = chunk_text(text, max_tokens=budget, overlap=0, tokenizer=tokenizer)
+        partial = summarize_batch([c.text for c in chunks], map_tokens, min(30, map_tokens // 2), batch_size)
+        print(f"[INFO] Summary level {level + 1}: {n_tokens} tokens -> {len(chunks)} chunks")
+        reduced = "\n".join(p.strip() for p in partial if p.strip())
+        reduced_tokens = len(tokenizer(reduced, add_special_tokens=False)["input_ids"])
+        level += 1
+        if reduced_tokens >= n_tokens:  # the model is not shrinking it; more levels will not help
+            break
+        text, n_tokens = reduced, reduced_tokens
+    if n_tokens > budget:
+        # never cut to the first chunk: keep the most central sentences of the whole text
+        print(f"[WARN] Summary still {n_tokens} tokens after {level} levels; keeping its central sentences")
+        text = extractive.prefilter(text, budget, tokenizer)
+    return summarize_text(text, max_length=max_length, min_length=min_length)
+
+def summarize_sections(sections: List[dict], per_section_max: int = 120) -> List[dict]:
+    """
+    Summarize multiple sections in batches for better performance.
+    """
     # Prepare inputs
     inputs = []
     titles = []
@@ -50,17 +200,8 @@ def summarize_sections(sections: List[dict], per_section_max: int = 120) -> List
     # Filter out None values before sending to model
     batch_texts = [txt for txt in inputs if txt]
 
-    # Run summarizer in a single batch call
-    summaries = []
-    if batch_texts:
-        raw_summaries = summarizer(
-            batch_texts,
-            max_new_tokens=per_section_max,
-            min_length=30,
-            do_sample=False,
-            clean_up_tokenization_spaces=True
-        )
-        summaries = [r["summary_text"] for r in raw_summaries]
+    # Run summarizer in length-sorted, token-bounded batches
+    summaries = summarize_batch(batch_texts, per_section_max, 30)
 
     # Rebuild final list with correct order
     results = []
@@ -0,0 +1,152 @@
+# app/services/summary_store.py
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+from sqlalchemy import select, insert, delete, func
+from app.db.database import engine, Base, SessionLocal
+from app.db.models import Summary, Document, Section
+from app.services import model_registry
+from app.services.summarizer import SUMMARIZER_MODEL, summarize_long, summarize_sections
+
+# Summaries are stored in SQLite keyed by (doc, section, model, params, text hash), so a
+# repeat request for unchanged text is a single row lookup. Rows of a document are dropped
+# when it is deleted or re-ingested; the text hash keeps anything missed from being served.
+SUMMARY_STORE = os.environ.get("SUMMARY_STORE", "1").lower() in ("1", "true", "yes")
+SUMMARY_PRECOMPUTE = os.environ.get("SUMMARY_PRECOMPUTE", "0").lower() in ("1", "true", "yes")
+DOC_SUMMARY_MAX = 500
+DOC_SUMMARY_MIN = 50
+SECTION_SUMMARY_MAX = 120
+
+_summaries = Summary.__table__
+Base.metadata.create_all(bind=engine)
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "precomputed": 0}
+
+
+def _model_name() -> str:
+    # int8 weights change the output, so they are a different "model" here
+    return SUMMARIZER_MODEL + (":int8" if model_registry.GEN_INT8 else "")
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _row(doc_id: Optional[int], section_id: Optional[int], params: Dict[str, Any], text: str) -> Dict[str, Any]:
+    row = {"doc_id": doc_id, "section_id": section_id, "model": _model_name(),
+           "params": json.dumps(params, sort_keys=True), "text_hash": _text_hash(text)}
+    raw = json.dumps([row[k] for k in ("doc_id", "section_id", "model", "params", "text_hash")])
+    row["key"] = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    return row
+
+
+def _lookup(keys: List[str]) -> Dict[str, str]:
+    if not SUMMARY_STORE or not keys:
+        return {}
+    found = {}
+    with engine.connect() as conn:
+        for i in range(0, len(keys), 500):  # stay under SQLite's bound-parameter limit
+            stmt = select(_summaries.c.key, _summaries.c.summary).where(_summaries.c.key.in_(keys[i:i + 500]))
+            found.update({r.key: r.summary for r in conn.execute(stmt)})
+    _stats["hits"] += len(found)
+    _stats["misses"] += len(set(keys)) - len(found)
+    return found
+
+
+def _store(rows: List[Dict[str, Any]]):
+    if SUMMARY_STORE and rows:
+        with engine.begin() as conn:
+            conn.execute(insert(_summaries).prefix_with("OR REPLACE"), rows)
+
+
+def document_summary(doc_id: Optional[int], text: str, max_length: int = DOC_SUMMARY_MAX,
+                     min_length: int = DOC_SUMMARY_MIN, prefilter: bool = False) -> Dict[str, Any]:
+    """Stored summary of a document's text, computed (hierarchically) and stored on a miss."""
+    params = {"kind": "document", "max_length": max_length, "min_length": min_length}
+    if prefilter:
+        params["prefilter"] = True
+    row = _row(doc_id, None, params, text)
+    cached = _lookup([row["key"]]).get(row["key"])
+    if cached is not None:
+        return {"summary": cached, "cached": True}
+    row["summary"] = summarize_long(text, max_length=max_length, min_length=min_length, prefilter=prefilter)
+    _store([row])
+    return {"summary": row["summary"], "cached": False}
+
+
+def section_summaries(sections: List[dict], per_section_max: int = SECTION_SUMMARY_MAX,
+                      doc_id: Optional[int] = None) -> List[dict]:
+    """
+    summarize_sections() with stored results: only sections whose summary is not stored
+    yet go through the model. Sections may carry an "id" (stored Section rows).
+    """
+    params = {"kind": "section", "max_length": per_section_max}
+    rows = [_row(doc_id, s.get("id"), params, s.get("content") or "") for s in sections]
+    found = _lookup([r["key"] for r in rows])
+    missing = [i for i, r in enumerate(rows) if r["key"] not in found]
+    if missing:
+        computed = summarize_sections([sections[i] for i in missing], per_section_max)
+        fresh = []
+        for i, res in zip(missing, computed):
+            found[rows[i]["key"]] = res["summary"]
+            if res["summary"]:  # empty sections are not worth a row
+                fresh.append({**rows[i], "summary": res["summary"]})
+        _store(fresh)
+    return [{"title": s.get("title"), "summary": found[r["key"]]} for s, r in zip(sections, rows)]
+
+
+def stored_sections(db, doc_id: int) -> List[dict]:
+    rows = db.query(Section).filter(Section.document_id == doc_id).order_by(Section.id).all()
+    return [{"id": s.id, "title": s.title, "level": s.level, "content": s.content} for s in rows]
+
+
+def invalidate(doc_id: int):
+    """Drop every stored summary of a document (deleted, or its text/sections are being replaced)."""
+    with engine.begin() as conn:
+        conn.execute(delete(_summaries).where(_summaries.c.doc_id == doc_id))
+
+
+def _precompute(doc_id: int):
+    db = SessionLocal()
+    try:
+        doc = db.query(Document).filter(Document.id == doc_id).first()
+        if doc is None or not (doc.text or "").strip():
+            return
+        text, sections = doc.text.strip(), stored_sections(db, doc_id)
+    finally:
+        db.close()
+    try:
+        document_summary(doc_id, text)
+        if sections:
+            section_summaries(sections, doc_id=doc_id)
+        _stats["precomputed"] += 1
+    except Exception as e:
+        print(f"[WARN] Summary precompute for document {doc_id} failed: {e}")
+
+
+def schedule(doc_id: int):
+    """Queue a document's summaries to be computed in the background (one worker, model-bound)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary")
+        _pool.submit(_precompute, doc_id)
+
+
+def stats() -> Dict[str, Any]:
+    with engine.connect() as conn:
+        rows = conn.execute(select(func.count()).select_from(_summaries)).scalar()
+    return {"enabled": SUMMARY_STORE, "rows": rows, "model": _model_name(), **_stats}
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
@@ -1,9 +1,61 @@
 import os
-from ..config import UPLOAD_DIR
-
-def save_file(file, filename: str) -> str:
-    """Save uploaded file to local uploads directory."""
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    with open(file_path, "wb") as buffer:
-        buffer.write(file)
-    return file_path
+import hashlib
+import tempfile
+from typing import Tuple
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+from ..config import UPLOAD_DIR, MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES."""
+
+def _copy_stream(src, upload_dir: str, filename: str, chunk_size: int, max_bytes: int) -> Tuple[str, str]:
+    """
+    Copy a file object into upload_dir chunk by chunk. The data goes to a uniquely named
+    temp file first and is then moved to <upload_dir>/<sha256>/<filename>, so uploads that
+    share a name never share a path. Returns (path, SHA-256 hex digest).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    tmp = tempfile.NamedTemporaryFile(dir=upload_dir, prefix=".upload-", suffix=".part", delete=False)
+    try:
+        with tmp as buffer:
+            while True:
+                chunk = src.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise UploadTooLarge(f"File exceeds the upload limit of {max_bytes} bytes")
+                digest.update(chunk)
+                buffer.write(chunk)
+        sha = digest.hexdigest()
+        target_dir = os.path.join(upload_dir, sha)
+        os.makedirs(target_dir, exist_ok=True)
+        file_path = os.path.join(target_dir, filename)
+        os.replace(tmp.name, file_path)  # same digest -> same bytes, so replacing is harmless
+    except BaseException:
+        if os.path.exists(tmp.name):
+            os.remove(tmp.name)
+        raise
+    return file_path, sha
+
+async def save_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES,
+                      chunk_size: int = UPLOAD_CHUNK_SIZE) -> Tuple[str, str]:
+    """
+    Stream an UploadFile to the uploads directory without buffering it in memory.
+    Returns (path, sha256 hex digest); the path is content-addressed, uploads/<sha256>/<name>.
+    Raises UploadTooLarge past max_bytes.
+    """
+    filename = os.path.basename(file.filename or "") or "upload"
+    await file.seek(0)
+    # blocking disk I/O runs off the event loop
+    return await run_in_threadpool(_copy_stream, file.file, UPLOAD_DIR, filename, chunk_size, max_bytes)
+
+def file_sha256(path: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    """SHA-256 hex digest of a file on disk, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
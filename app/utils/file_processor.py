@@ -1,8 +1,8 @@
 import os
 from typing import Optional
 from fastapi import UploadFile
-from app.utils.file_handler import save_file
-from app.services.extractor import extract_and_clean
+from app.utils.file_handler import save_upload
+from app.services.extraction_cache import extract_and_clean_cached
 
 async def process_upload(file: Optional[UploadFile], raw_text: Optional[str] = None):
     """
@@ -11,10 +11,9 @@ async def process_upload(file: Optional[UploadFile], raw_text: Optional[str] = N
     Returns (source_name, text).
     """
     if file:
-        file_bytes = await file.read()
-        path = save_file(file_bytes, file.filename)
+        path, digest = await save_upload(file)
         ext = os.path.splitext(file.filename)[-1].replace(".", "")
-        text = extract_and_clean(path, ext)
+        text = extract_and_clean_cached(path, ext, digest)
         return file.filename, text
     elif raw_text:
         return "raw_text", raw_text
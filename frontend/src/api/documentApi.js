@@ -14,5 +14,19 @@ export async function uploadDocument(file) {
       headers: { "Content-Type": "multipart/form-data" },
     }
   );
-  return res.data; // returns { filename, path, doc_id, extracted_text }
+  // returns { filename, path, doc_id, job_id, status } — ingestion runs in the background
+  await waitForJob(res.data.job_id);
+  return res.data;
+}
+
+export async function waitForJob(jobId, intervalMs = 1000) {
+  // poll until the ingestion job completes or fails
+  for (;;) {
+    const res = await axios.get(`${API_BASE}/jobs/${jobId}`);
+    if (res.data.status === "completed") return res.data;
+    if (res.data.status === "failed") {
+      throw new Error(res.data.error || "Ingestion failed");
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
 }
@@ -6,3 +6,37 @@ export async function askQuestion(payload) {
   const res = await axios.post(`${API_BASE}/nlp/qa`, payload);
   return res.data;
 }
+
+// Streams the answer from /nlp/qa/stream (Server-Sent Events).
+// onToken(text) is called for each generated piece; resolves with { answer, sources }.
+export async function askQuestionStream(payload, onToken) {
+  const res = await fetch(`${API_BASE}/nlp/qa/stream`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(payload),
+  });
+  if (!res.ok) throw new Error(`QA request failed: ${res.status}`);
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let sources = [];
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let sep;
+    while ((sep = buffer.indexOf("\n\n")) !== -1) {
+      const block = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+      const line = block.split("\n").find((l) => l.startsWith("data: "));
+      if (!line) continue;
+      const ev = JSON.parse(line.slice(6));
+      if (ev.event === "sources") sources = ev.sources;
+      else if (ev.event === "token") onToken(ev.text);
+      else if (ev.event === "error") throw new Error(ev.detail);
+      else if (ev.event === "done") return { answer: ev.answer, sources };
+    }
+  }
+  return { answer: "", sources };
+}